@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from web.src.models.similarity_matrix import SimilarityMatrix
+from web.src.models.solution import Solution
+from web.src.utils.diff_utils import TABLE_BUILDERS, load_assignments
+from web.src.utils.minhash_utils import find_candidate_pairs
+from web.src.utils.store_utils import ScoreStore
+from web.src.utils.top_pairs_utils import DEFAULT_TOP_PAIRS
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ("npz", "csv", "parquet")
+
+
+def load_solutions(folder: str) -> List[Solution]:
+    # the same layout the web server clones into: <folder>/<owner>/<path_to_file>
+    return [
+        Solution(owner, os.path.join(folder, owner))
+        for owner in sorted(os.listdir(folder))
+        if os.path.isdir(os.path.join(folder, owner))
+    ]
+
+
+def get_output_name(path_to_file: str) -> str:
+    return path_to_file.replace("/", "__")
+
+
+def write_npz(path: str, tables: Dict[str, SimilarityMatrix]):
+    owners = next(iter(tables.values())).owners
+    np.savez_compressed(
+        path,
+        owners=np.array(owners),
+        metrics=np.array(list(tables)),
+        higher_is_similar=np.array([table.higher_is_similar for table in tables.values()]),
+        **{metric: table.values for metric, table in tables.items()}
+    )
+
+
+def write_csv(path: str, tables: Dict[str, SimilarityMatrix]):
+    for metric, table in tables.items():
+        with open(f"{path}.{metric}.csv", "w", encoding="utf-8", newline="") as file:
+            file.write(table.to_csv())
+
+
+def write_parquet(path: str, tables: Dict[str, SimilarityMatrix]):
+    # one row per scored pair, so every metric of a file fits into one table
+    columns = {"metric": [], "first": [], "second": [], "score": []}
+    for metric, table in tables.items():
+        rows, cols = np.nonzero(~np.isnan(table.values))
+        columns["metric"] += [metric] * len(rows)
+        columns["first"] += [table.owners[row_num] for row_num in rows]
+        columns["second"] += [table.owners[col_num] for col_num in cols]
+        columns["score"] += table.values[rows, cols].tolist()
+    pyarrow.parquet.write_table(pyarrow.table(columns), path, compression="zstd")
+
+
+WRITERS = {
+    "npz": lambda path, tables: write_npz(path + ".npz", tables),
+    "csv": write_csv,
+    "parquet": lambda path, tables: write_parquet(path + ".parquet", tables),
+}
+
+
+def print_top_pairs(path_to_file: str, metric: str, pairs: List[dict]):
+    print(f"\n{path_to_file} {metric}")
+    for pair in pairs:
+        print(f"{pair['first']:<30} {pair['second']:<30} {pair['score']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a local folder of solutions without the web server")
+    parser.add_argument("folder", help="folder with a subfolder per student, like tmp/<owner>/<path_to_file>")
+    parser.add_argument("--paths", required=True, help="comma separated files or glob patterns inside every subfolder")
+    parser.add_argument("--metrics", default="similarity", help="comma separated, any of: " + ", ".join(TABLE_BUILDERS))
+    parser.add_argument("--formats", default="npz", help="comma separated, any of: " + ", ".join(FORMATS))
+    parser.add_argument("--output", default="batch", help="folder to write the matrices and top_pairs.json to")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP_PAIRS, help="most suspicious pairs reported per table")
+    parser.add_argument("--suspicious", action="store_true", help="score only the pairs that minhash finds similar")
+    parser.add_argument("--store", help="score store to reuse the scores of unchanged pairs from")
+    args = parser.parse_args()
+
+    metrics = [metric.strip() for metric in args.metrics.split(",") if metric.strip()]
+    formats = [output_format.strip() for output_format in args.formats.split(",") if output_format.strip()]
+    patterns = [path.strip() for path in args.paths.split(",") if path.strip()]
+    for metric in metrics:
+        if metric not in TABLE_BUILDERS:
+            parser.error(f"unknown metric '{metric}'")
+    for output_format in formats:
+        if output_format not in FORMATS:
+            parser.error(f"unknown format '{output_format}'")
+    if "parquet" in formats and pyarrow is None:
+        parser.error("parquet output needs pyarrow to be installed")
+
+    store = ScoreStore(args.store) if args.store else None
+    assignments = load_assignments(load_solutions(args.folder), patterns)
+    if not assignments:
+        parser.error("no solution matches the given paths")
+    os.makedirs(args.output, exist_ok=True)
+
+    report = {}
+    for path_to_file, assignment in assignments.items():
+        corpus = assignment.corpus
+        pairs = find_candidate_pairs(corpus.contents) if args.suspicious else None
+        tables = {}
+        for metric in metrics:
+            started = time.perf_counter()
+            tables[metric] = TABLE_BUILDERS[metric](corpus, pairs=pairs, store=store)
+            print(f"{path_to_file} {metric}: {len(corpus)} students, {time.perf_counter() - started:.1f} s")
+        for output_format in formats:
+            WRITERS[output_format](os.path.join(args.output, get_output_name(path_to_file)), tables)
+        report[path_to_file] = {metric: table.top_pairs(args.top) for metric, table in tables.items()}
+
+    for path_to_file, top_pairs in report.items():
+        for metric, pairs in top_pairs.items():
+            print_top_pairs(path_to_file, metric, pairs)
+    with open(os.path.join(args.output, "top_pairs.json"), "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import argparse
+import glob
+import re
+import timeit
+
+from benchmarks.synthetic_corpus import generate_source
+from web.src.utils.normalize_utils import clean_cache, clean_solution_content, normalize_source
+
+regex_to_remove_comment = r'{-[^}]*-}|[\t\s]*--[^\n]*'
+regex_to_remove_unnecessary_spaces = r'[^\S\r\n\t]{2,}'
+regex_to_remove_unnecessary_tabs = r'\t+'
+
+
+def legacy_clean_solution_content(solution_content: str) -> str:
+    solution_content = re.sub(pattern=regex_to_remove_comment, repl='', string=solution_content)
+    solution_content = re.sub(pattern=regex_to_remove_unnecessary_tabs, repl=' ', string=solution_content)
+    solution_content = re.sub(pattern=regex_to_remove_unnecessary_spaces, repl=' ', string=solution_content)
+    solution_content = '\n'.join([line.strip() for line in solution_content.split('\n') if line.strip() != ''])
+    return solution_content
+
+
+def report(name: str, function, content: str, number: int):
+    seconds = min(timeit.repeat(lambda: function(content), number=number, repeat=5)) / number
+    print(f"{name:<24} {seconds * 1e6:>10.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the source normalizers")
+    parser.add_argument("files", nargs="*", help="sources to normalize, a synthetic one is used by default")
+    parser.add_argument("--lines", type=int, default=2000)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    paths = [path for pattern in args.files for path in glob.glob(pattern)]
+    contents = [open(path, encoding="utf-8").read() for path in paths] or [generate_source(args.lines)]
+    content = "\n".join(contents)
+    print(f"{len(contents)} source(s), {len(content)} characters")
+    report("legacy re.sub", legacy_clean_solution_content, content, args.number)
+    report("single pass", normalize_source, content, args.number)
+    clean_cache.clear()
+    clean_solution_content(content)
+    report("cached", clean_solution_content, content, args.number)
+
+
+if __name__ == "__main__":
+    main()
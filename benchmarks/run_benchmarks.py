@@ -0,0 +1,186 @@
+import argparse
+import difflib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+from benchmarks.synthetic_corpus import generate_corpus, generate_source, mutate_source
+from web.src.models.corpus import Corpus
+from web.src.utils import diff_utils
+from web.src.utils.diff2HtmlCompare.diff2HtmlCompare import compare
+from web.src.utils.diff_page_utils import DIFF_ENGINES
+from web.src.utils.job_utils import Job
+from web.src.utils.normalize_utils import clean_cache, clean_solution_content
+
+
+def get_version() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(function: Callable, repeat: int, track_memory: bool) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    result = {"seconds": min(timings), "timings": timings}
+    if track_memory:
+        # a separate run, tracing allocations slows the measured one down;
+        # allocations made inside the process pool workers are not seen
+        tracemalloc.start()
+        function()
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def count_pairs(corpus: Corpus, builder: Callable) -> int:
+    # asymmetric tables score both orders of a pair, so the count comes from the builder's own progress,
+    # in a separate run: reporting progress slows down the builders that fill the whole matrix at once
+    progress = Job("benchmark", corpus.owners)
+    builder(corpus, progress=progress)
+    return progress.total
+
+
+def run_builders(corpus: Corpus, builders: Dict[str, Callable], repeat: int, track_memory: bool) -> List[dict]:
+    results = []
+    for name, builder in builders.items():
+        pairs = count_pairs(corpus, builder)
+        result = measure(lambda: builder(corpus), repeat, track_memory)
+        result.update(name=f"table/{name}", students=len(corpus), pairs=pairs,
+                      pairs_per_second=pairs / result["seconds"] if result["seconds"] else None)
+        results.append(result)
+        print_result(result)
+    return results
+
+
+def run_clean(sources: List[str], repeat: int, track_memory: bool) -> dict:
+    def clean_all():
+        clean_cache.clear()
+        for source in sources:
+            clean_solution_content(source)
+
+    result = measure(clean_all, repeat, track_memory)
+    characters = sum(len(source) for source in sources)
+    result.update(name="clean_solution_content", students=len(sources), characters=characters,
+                  characters_per_second=characters / result["seconds"] if result["seconds"] else None)
+    print_result(result)
+    return result
+
+
+def run_compare(sources: List[str], repeat: int, track_memory: bool) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for num, source in enumerate(sources[:2]):
+            paths.append(os.path.join(directory, f"solution{num}.hs"))
+            with open(paths[-1], "w", encoding="utf-8") as file:
+                file.write(source)
+        result = measure(lambda: compare(paths[0], paths[1], "first", "second"), repeat, track_memory)
+    result.update(name="compare", students=2, lines=sum(source.count("\n") + 1 for source in sources[:2]),
+                  pages_per_second=1 / result["seconds"] if result["seconds"] else None)
+    print_result(result)
+    return result
+
+
+def run_diff_engines(lines: int, mutation_rate: float, seed: int, repeat: int, track_memory: bool) -> List[dict]:
+    # the side-by-side alignment alone, on a copied and on an unrelated pair of large files
+    original = generate_source(lines, seed)
+    pairs = {
+        "similar": (original, mutate_source(original, mutation_rate, random.Random(seed))),
+        "unrelated": (original, generate_source(lines, seed + 1))
+    }
+    results = []
+    for case, (first, second) in pairs.items():
+        first_lines = [line + "\n" for line in first.split("\n")]
+        second_lines = [line + "\n" for line in second.split("\n")]
+        for engine, mdiff in DIFF_ENGINES.items():
+            result = measure(
+                lambda: list(mdiff(first_lines, second_lines, linejunk=None, charjunk=difflib.IS_CHARACTER_JUNK)),
+                repeat, track_memory
+            )
+            result.update(name=f"mdiff/{engine}/{case}", students=2, lines=len(first_lines) + len(second_lines))
+            results.append(result)
+            print_result(result)
+    return results
+
+
+def print_result(result: dict):
+    memory = result.get("peak_memory_bytes")
+    print(f"{result['name']:<40} n={result['students']:<6} {result['seconds'] * 1000:>10.1f} ms"
+          + (f" {memory / 2 ** 20:>8.1f} MiB" if memory is not None else ""))
+
+
+def load_baseline(baseline_path: str) -> Dict[tuple, float]:
+    with open(baseline_path, encoding="utf-8") as file:
+        return {(result["name"], result["students"]): result["seconds"] for result in json.load(file)["results"]}
+
+
+def compare_with_baseline(results: List[dict], baseline: Dict[tuple, float]):
+    print("\nspeedup against the baseline")
+    for result in results:
+        previous = baseline.get((result["name"], result["students"]))
+        if previous:
+            print(f"{result['name']:<40} n={result['students']:<6} {previous / result['seconds']:>8.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the table builders, the normalizer and the diff page")
+    parser.add_argument("--students", default="10,20,40", help="comma separated corpus sizes of the scaling curve")
+    parser.add_argument("--lines", type=int, default=150, help="lines in every synthetic solution")
+    parser.add_argument("--mutation-rate", type=float, default=0.1, help="share of lines a student changes")
+    parser.add_argument("--diff-lines", type=int, default=3000, help="lines in every file of the diff engine run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--builders", help="comma separated builders, all create_*_table functions by default")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--output", default="benchmark.json", help="where to write the JSON result")
+    parser.add_argument("--baseline", help="a previous JSON result to compare against")
+    args = parser.parse_args()
+
+    builders = diff_utils.TABLE_BUILDERS
+    if args.builders:
+        builders = {name: builders[name] for name in args.builders.split(",")}
+    track_memory = not args.no_memory
+    baseline = load_baseline(args.baseline) if args.baseline else None
+
+    results = []
+    for students in [int(students) for students in args.students.split(",")]:
+        sources = generate_corpus(students, args.lines, args.mutation_rate, args.seed)
+        results.append(run_clean(sources, args.repeat, track_memory))
+        contents = [clean_solution_content(source) for source in sources]
+        corpus = Corpus([f"student{num}" for num in range(students)], contents)
+        results.extend(run_builders(corpus, builders, args.repeat, track_memory))
+    results.append(run_compare(generate_corpus(2, args.lines, args.mutation_rate, args.seed), args.repeat, track_memory))
+    results.extend(run_diff_engines(args.diff_lines, args.mutation_rate, args.seed, args.repeat, track_memory))
+
+    report = {
+        "version": get_version(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "results": results
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nwritten to {args.output}")
+    if baseline is not None:
+        compare_with_baseline(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import random
+from typing import List
+
+# mostly code, with the comments, literals and blank runs the normalizer has to handle
+LINE_TEMPLATES = [
+    "{name} :: [Int] -> Int",
+    "{name} xs = foldr (\\x acc -> x + acc) 0 xs",
+    "  where go  acc   (y : ys) = go (acc + y) ys",
+    "\t{name}' = map   (* 2) [1, 2, 3]",
+    "    | otherwise = {name} (n - 1)",
+    "{name} xs = sum xs  -- sum of {name}",
+    "{{- helper for {name} -}}",
+    'greeting = putStrLn "hello  --  {name}"',
+    "",
+]
+
+
+def generate_source(lines: int, seed: int = 0) -> str:
+    generator = random.Random(seed)
+    return "\n".join(
+        generator.choice(LINE_TEMPLATES).format(name="f" + str(generator.randrange(1000))) for _ in range(lines)
+    )
+
+
+def mutate_source(source: str, mutation_rate: float, generator: random.Random) -> str:
+    # the edits students make to a copied solution: renames, dropped, duplicated and rewritten lines
+    lines = []
+    for line in source.split("\n"):
+        if generator.random() >= mutation_rate:
+            lines.append(line)
+            continue
+        mutation = generator.randrange(4)
+        if mutation == 0:
+            lines.append(line.replace("f", "g" + str(generator.randrange(10))))
+        elif mutation == 1:
+            lines.extend([line, line])
+        elif mutation == 2:
+            lines.append(generator.choice(LINE_TEMPLATES).format(name="h" + str(generator.randrange(1000))))
+    return "\n".join(lines)
+
+
+def generate_corpus(students: int, lines: int, mutation_rate: float, seed: int = 0) -> List[str]:
+    # every student copies one of a few original solutions, so the corpus has both similar and unrelated pairs
+    generator = random.Random(seed)
+    originals = [generate_source(lines, seed + original) for original in range(max(1, students // 4))]
+    return [mutate_source(generator.choice(originals), mutation_rate, generator) for _ in range(students)]
@@ -2,9 +2,11 @@ import uvicorn
 from fastapi import FastAPI
 
 from web.src.endpoints.endpoints import router
+from web.src.state.state import SessionCookieMiddleware
 
 app = FastAPI()
 app.include_router(router)
+app.add_middleware(SessionCookieMiddleware)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", port=8000, host="0.0.0.0", reload=False)
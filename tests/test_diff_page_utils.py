@@ -0,0 +1,81 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from web.src.utils import diff_page_utils
+from web.src.utils.async_utils import executor
+from web.src.utils.diff_page_utils import DiffPage, diff_cache, diff_renders
+
+
+class DiffPageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.paths = []
+        for owner in ("first", "second"):
+            path = os.path.join(self.folder.name, owner + ".hs")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(f"main = putStrLn \"{owner}\"\n")
+            self.paths.append(path)
+        diff_cache.clear()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_concurrent_requests_share_one_render(self):
+        renders = []
+
+        def slow_compare_stream(*args):
+            renders.append(args)
+            for chunk in ("head", "left", "right"):
+                time.sleep(0.05)
+                yield chunk
+
+        readers = 3
+        barrier = threading.Barrier(readers)
+        pages = []
+
+        def read():
+            barrier.wait()
+            pages.append("".join(DiffPage(*self.paths, "first", "second").stream()))
+
+        with mock.patch.object(diff_page_utils, "compare_stream", slow_compare_stream):
+            threads = [threading.Thread(target=read) for _ in range(readers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(1, len(renders))
+        self.assertEqual(["headleftright"] * readers, pages)
+        self.assertEqual("headleftright", DiffPage(*self.paths, "first", "second").cached_html())
+        self.assertEqual({}, diff_renders)
+
+    def test_render_errors_reach_every_reader(self):
+        def failing_compare_stream(*args):
+            yield "head"
+            raise UnicodeDecodeError("utf-8", b"", 0, 1, "broken")
+
+        with mock.patch.object(diff_page_utils, "compare_stream", failing_compare_stream):
+            with self.assertRaises(UnicodeDecodeError):
+                "".join(DiffPage(*self.paths, "first", "second").stream())
+        self.assertIsNone(DiffPage(*self.paths, "first", "second").cached_html())
+        self.assertEqual({}, diff_renders)
+
+    def test_render_does_not_wait_for_table_jobs(self):
+        jobs_done = threading.Event()
+        jobs = [executor.submit(jobs_done.wait) for _ in range(executor._max_workers + 1)]
+        try:
+            with mock.patch.object(diff_page_utils, "compare_stream", lambda *args: iter(["page"])):
+                self.assertEqual("page", "".join(DiffPage(*self.paths, "first", "second").stream()))
+        finally:
+            jobs_done.set()
+        for job in jobs:
+            job.result()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from benchmarks.synthetic_corpus import generate_corpus
+from web.src.models.corpus import Corpus
+from web.src.utils.diff_utils import compute_comparison_matrix, sequence_matcher_ratio
+from web.src.utils.job_utils import StreamingJob
+from web.src.utils.store_utils import ScoreStore
+
+calls = []
+
+
+def counted_ratio(first: str, second: str) -> float:
+    calls.append((first, second))
+    return sequence_matcher_ratio(first, second)
+
+
+class StreamingJobTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = ScoreStore(os.path.join(self.folder.name, "scores.sqlite3"))
+        self.contents = generate_corpus(6, 40, 0.2)
+        calls.clear()
+
+    def tearDown(self):
+        self.store.connection.close()
+        self.folder.cleanup()
+
+    def stream(self) -> StreamingJob:
+        job = StreamingJob("similarity", Corpus([], []), counted_ratio, symmetric=False, store=self.store)
+        for num, content in enumerate(self.contents):
+            job.add_document(f"student{num}", content)
+        job.finish()
+        return job
+
+    def test_streamed_rows_match_the_full_table(self):
+        job = self.stream()
+        expected = compute_comparison_matrix(
+            Corpus([f"student{num}" for num in range(len(self.contents))], self.contents), counted_ratio, symmetric=False
+        )
+        np.testing.assert_allclose(expected, job.table.values, rtol=1e-6)
+        self.assertEqual(len(self.contents) * (len(self.contents) - 1), job.done)
+
+    def test_known_scores_come_from_the_store(self):
+        first = self.stream()
+        calls.clear()
+        second = self.stream()
+        self.assertEqual([], calls)
+        np.testing.assert_array_equal(first.table.values, second.table.values)
+
+        owners = [f"student{num}" for num in range(len(self.contents))]
+        compute_comparison_matrix(Corpus(owners, self.contents), counted_ratio, symmetric=False, store=self.store)
+        self.assertEqual([], calls)
+
+    def test_finished_job_keeps_only_its_table(self):
+        job = self.stream()
+        self.assertEqual(0, job.matrix.nbytes)
+        self.assertEqual(job.table.format_row(1), job.row(1))
+        self.assertEqual("done", job.progress()["status"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import difflib
+import re
+import unittest
+
+from benchmarks.synthetic_corpus import generate_corpus, generate_source
+from web.src.utils.line_diff_utils import _find_unique_anchors, get_matching_pairs, histogram_mdiff
+
+MDIFF_ARGUMENTS = {"linejunk": None, "charjunk": difflib.IS_CHARACTER_JUNK}
+
+
+def strip_markup(text: str) -> str:
+    return re.sub("\0[+\\-^]|\1", "", text)
+
+
+class LineDiffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = [content.split("\n") for content in generate_corpus(6, 300, 0.2)]
+
+    def test_anchors_are_the_longest_increasing_run_of_unique_lines(self):
+        a = ["a", "b", "c", "d"]
+        b = ["d", "a", "b", "c"]
+        self.assertEqual([(0, 1), (1, 2), (2, 3)], _find_unique_anchors(a, b, 0, len(a), 0, len(b)))
+
+    def test_matching_pairs_are_a_common_subsequence(self):
+        for a in self.corpus:
+            for b in self.corpus:
+                matches = get_matching_pairs(a, b)
+                for (i, j), (next_i, next_j) in zip(matches, matches[1:]):
+                    self.assertLess(i, next_i)
+                    self.assertLess(j, next_j)
+                self.assertTrue(all(a[i] == b[j] for i, j in matches))
+
+    def test_mdiff_keeps_intraline_markup(self):
+        a = ["x = 1\n", "def f():\n", "    return 2\n", "y\n"]
+        b = ["x = 1\n", "def f():\n", "    return 3\n", "y\n", "z\n"]
+        self.assertEqual(list(difflib._mdiff(a, b, **MDIFF_ARGUMENTS)), list(histogram_mdiff(a, b, **MDIFF_ARGUMENTS)))
+
+    def test_mdiff_shows_every_line_once(self):
+        for a in self.corpus[:3]:
+            for b in self.corpus[3:]:
+                a_lines, b_lines = [line + "\n" for line in a], [line + "\n" for line in b]
+                rows = list(histogram_mdiff(a_lines, b_lines, **MDIFF_ARGUMENTS))
+                for side, lines in enumerate((a_lines, b_lines)):
+                    numbered = [row[side] for row in rows if row[side][0] != '']
+                    self.assertEqual(list(range(1, len(lines) + 1)), [number for number, _ in numbered])
+                    self.assertEqual(lines, [strip_markup(text) for _, text in numbered])
+
+    def test_mdiff_keeps_as_many_unchanged_lines_as_difflib_on_large_files(self):
+        a_lines = [line + "\n" for line in generate_source(2500, 1).split("\n")]
+        b_lines = [line + "\n" for line in generate_source(2500, 2).split("\n")]
+        rows = list(histogram_mdiff(a_lines, b_lines, **MDIFF_ARGUMENTS))
+        unchanged = [(left, right) for left, right, changed in rows if not changed]
+        self.assertTrue(all(left[1] == right[1] for left, right in unchanged))
+        difflib_unchanged = [row for row in difflib._mdiff(a_lines, b_lines, **MDIFF_ARGUMENTS) if not row[2]]
+        self.assertGreaterEqual(len(unchanged), len(difflib_unchanged))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,19 @@
+import unittest
+
+from web.src.utils.normalize_utils import clean_cache, clean_solution_content, normalize_source
+
+
+class CleanSolutionContentTest(unittest.TestCase):
+
+    def setUp(self):
+        clean_cache.clear()
+
+    def test_cleaned_text_is_cleaned_again(self):
+        # removing the block comment joins two dashes into a line comment, so normalizing is not idempotent
+        cleaned = clean_solution_content("a -{- x -}- b")
+        self.assertEqual("a -- b", cleaned)
+        self.assertEqual(normalize_source(cleaned), clean_solution_content(cleaned))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import threading
+import time
+import unittest
+
+from web.src.utils.parallel_utils import compare_pairs
+
+
+def first_length(first: str, second: str) -> int:
+    # sleeping lets the other thread run in the middle of a build
+    time.sleep(0.001)
+    return len(first)
+
+
+def second_length(first: str, second: str) -> int:
+    time.sleep(0.001)
+    return -len(second)
+
+
+class ComparePairsTest(unittest.TestCase):
+
+    def test_concurrent_in_process_builds_do_not_mix(self):
+        corpora = {
+            first_length: ["a" * num for num in range(1, 6)],
+            second_length: ["b" * num for num in range(10, 15)]
+        }
+        pairs = [(row_num, col_num) for row_num in range(5) for col_num in range(5) if row_num != col_num]
+        barrier = threading.Barrier(len(corpora))
+        results = {}
+
+        def run(comparison_method):
+            barrier.wait()
+            results[comparison_method] = list(compare_pairs(corpora[comparison_method], comparison_method, pairs, 1))
+
+        threads = [threading.Thread(target=run, args=(method,)) for method in corpora]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for comparison_method, contents in corpora.items():
+            expected = [
+                (row_num, col_num, comparison_method(contents[row_num], contents[col_num]))
+                for row_num, col_num in pairs
+            ]
+            self.assertEqual(expected, results[comparison_method])
+
+
+if __name__ == "__main__":
+    unittest.main()
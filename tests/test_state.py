@@ -0,0 +1,147 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from web.src.models.login_info import LoginInfo
+from web.src.models.similarity_matrix import SimilarityMatrix
+from web.src.models.solution import Solution
+from web.src.state import state
+from web.src.state.state import StateManager, Workspace
+from web.src.utils.fork_utils import ParseException
+from web.src.utils.store_utils import ScoreStore
+
+
+def get_login_info(repository: str, path_to_file: str = "task/Main.hs") -> LoginInfo:
+    return LoginInfo(url=f"https://github.com/teacher/{repository}", branch="main", path_to_file=path_to_file)
+
+
+class StateManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.fork_listings = []
+        self.patches = [
+            mock.patch.object(state, "WORKSPACES_FOLDER", self.folder.name),
+            mock.patch.object(state, "ScoreStore", lambda: ScoreStore(os.path.join(self.folder.name, "scores.db"))),
+            mock.patch.object(state, "get_fork_urls", self.get_fork_urls),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.manager = StateManager()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.manager.score_store.connection.close()
+        self.folder.cleanup()
+
+    async def get_fork_urls(self, username: str, repository_name: str):
+        self.fork_listings.append(repository_name)
+        if repository_name == "missing":
+            raise ParseException("no such repository")
+        return []
+
+    def login(self, session_id: str, repository: str, path_to_file: str = "task/Main.hs") -> state.State:
+        session = self.manager.get(session_id)
+
+        async def run():
+            await session.login(get_login_info(repository, path_to_file))
+            if session.workspace.loading is not None:
+                await session.workspace.loading
+
+        asyncio.run(run())
+        return session
+
+    def test_new_sessions_are_logged_out(self):
+        session = self.manager.get("a")
+        self.assertFalse(session.is_authenticated())
+        self.assertEqual({}, self.manager.workspaces)
+
+    def test_sessions_share_a_workspace_and_release_it_together(self):
+        first, second = self.login("a", "course"), self.login("b", "course")
+        workspace = first.workspace
+        self.assertIs(workspace, second.workspace)
+        self.assertEqual(2, workspace.sessions)
+
+        first.clear()
+        first.clear()
+        self.assertEqual(1, workspace.sessions)
+        second.clear()
+        self.assertEqual(0, workspace.sessions)
+        self.assertEqual({}, self.manager.workspaces)
+
+    def test_login_to_a_held_workspace_keeps_its_tables(self):
+        first = self.login("a", "course")
+        table = SimilarityMatrix(["student"], np.zeros((1, 1)))
+        first.workspace.course_tables["similarity"] = table
+        second = self.login("b", "course")
+        self.assertIs(first.workspace, second.workspace)
+        self.assertIs(table, first.course_tables.get("similarity"))
+        self.assertEqual(["course"], self.fork_listings)
+
+    def test_login_to_a_workspace_no_one_else_holds_syncs_it_again(self):
+        self.login("a", "course")
+        self.login("a", "course")
+        self.assertEqual(["course", "course"], self.fork_listings)
+
+    def test_binary_files_do_not_stop_the_download(self):
+        solutions = []
+        for num in range(3):
+            folder = os.path.join(self.folder.name, "forks", f"student{num}")
+            os.makedirs(os.path.join(folder, "task"))
+            with open(os.path.join(folder, "task", "Main.hs"), "w", encoding="utf-8") as file:
+                file.write(f"main = print {num}\n")
+            solutions.append(Solution(f"student{num}", folder))
+        with open(os.path.join(solutions[0].folder_with_solution, "task", "Main.o"), "wb") as file:
+            file.write(b"\xcf\xfa\xed\xfe\x00\xff")
+
+        async def iter_downloaded_solutions(*args):
+            for solution in solutions:
+                yield solution
+
+        with mock.patch.object(state, "iter_downloaded_solutions", iter_downloaded_solutions):
+            session = self.login("a", "course", "task/*")
+        self.assertIsNone(session.workspace.loading.exception())
+        self.assertEqual(3, session.workspace.forks_downloaded)
+        self.assertEqual(3, len(session.assignments["task/Main.hs"].solutions))
+        self.assertEqual(["student0"], session.assignments["task/Main.o"].corpus.owners)
+
+    def test_failed_download_drops_the_workspace(self):
+        session = self.manager.get("a")
+        with self.assertRaises(ParseException):
+            asyncio.run(session.login(get_login_info("missing")))
+        self.assertFalse(session.is_authenticated())
+        self.assertEqual({}, self.manager.workspaces)
+
+    def test_least_recently_used_workspaces_are_evicted_first(self):
+        oldest, newest = self.login("a", "old"), self.login("b", "new")
+        current = self.login("c", "current")
+        self.manager.get("b")
+        sizes = {oldest.workspace: 10, newest.workspace: 10, current.workspace: 10}
+        measured = []
+
+        def memory_size(workspace: Workspace) -> int:
+            measured.append(workspace)
+            return sizes[workspace]
+
+        self.manager.memory_budget = 20
+        with mock.patch.object(Workspace, "memory_size", memory_size):
+            self.manager.get("c")
+        self.assertFalse(oldest.is_authenticated())
+        self.assertTrue(newest.is_authenticated())
+        self.assertTrue(current.is_authenticated())
+        self.assertEqual(3, len(measured))
+
+        self.manager.memory_budget = 0
+        with mock.patch.object(Workspace, "memory_size", memory_size):
+            self.manager.get("c")
+        self.assertFalse(newest.is_authenticated())
+        self.assertEqual([current.workspace], list(self.manager.workspaces.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from benchmarks.synthetic_corpus import generate_corpus
+from web.src.models.corpus import Corpus
+from web.src.utils import parallel_utils
+from web.src.utils.diff_utils import TABLE_BUILDERS
+from web.src.utils.top_pairs_utils import BOUNDED_METRICS, find_top_pairs, get_pair_arrays
+
+TOP_PAIRS = 5
+
+
+def get_scores(pairs: list) -> dict:
+    return {frozenset((pair["first"], pair["second"])): pair["score"] for pair in pairs}
+
+
+class TopPairsTest(unittest.TestCase):
+
+    def setUp(self):
+        contents = generate_corpus(8, 30, 0.2)
+        self.corpus = Corpus([f"student{num}" for num in range(len(contents))], contents)
+
+    def test_bounds_are_never_below_the_score(self):
+        rows, cols = get_pair_arrays(len(self.corpus), None)
+        for metric_name, metric in BOUNDED_METRICS.items():
+            features = metric.prepare(self.corpus.contents)
+            bounds = metric.bound(features, rows, cols)
+            for pair_num, (row_num, col_num) in enumerate(zip(rows, cols)):
+                score = metric.score(features, int(row_num), int(col_num))
+                self.assertGreaterEqual(bounds[pair_num] + 1e-9, score, metric_name)
+                for pair_bound in metric.pair_bounds:
+                    self.assertGreaterEqual(pair_bound(features, int(row_num), int(col_num)) + 1e-9, score, metric_name)
+
+    @mock.patch.object(parallel_utils, "DEFAULT_WORKERS", 1)
+    def test_pruned_search_matches_the_full_table(self):
+        for metric in BOUNDED_METRICS:
+            expected = TABLE_BUILDERS[metric](self.corpus).top_pairs(TOP_PAIRS)
+            actual, statistics = find_top_pairs(self.corpus, metric, TOP_PAIRS)
+            np.testing.assert_allclose(
+                [pair["score"] for pair in expected], [pair["score"] for pair in actual], rtol=1e-6, err_msg=metric
+            )
+            # pairs tied with the last score may be picked in either order, the ones above it may not
+            last = expected[-1]["score"]
+            above = {pair: score for pair, score in get_scores(expected).items() if not np.isclose(score, last)}
+            actual_scores = get_scores(actual)
+            for pair, score in above.items():
+                self.assertAlmostEqual(score, actual_scores[pair], places=5, msg=metric)
+
+    def test_no_pairs_are_asked_for(self):
+        for metric in BOUNDED_METRICS:
+            pairs, statistics = find_top_pairs(self.corpus, metric, 0)
+            self.assertEqual([], pairs)
+            self.assertEqual(0, statistics["scored"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+const CELL_WIDTH = 90;
+const CELL_HEIGHT = 24;
+const TILE_SIZE = 50;
+
+function sendRequest(method, url, onLoad, onError) {
+    let xhr = new XMLHttpRequest();
+    xhr.open(method, url, true);
+    xhr.onreadystatechange = function () {
+        if (this.readyState !== XMLHttpRequest.DONE) {
+            return;
+        }
+        if (this.status === 200) {
+            onLoad(JSON.parse(xhr.responseText));
+        } else if (onError) {
+            onError(this.status);
+        }
+    }
+    xhr.send();
+}
+
+function createVirtualTable(container, size, blockUrl) {
+    // only the tiles under the visible window are fetched and only their cells are in the DOM,
+    // so neither the response nor the page grows with the number of students
+    let tiles = new Map();
+    let requested = new Set();
+    let spacer = document.createElement('div');
+    let grid = document.createElement('div');
+    spacer.className = 'virtual-table-spacer';
+    grid.className = 'virtual-table-grid';
+    spacer.appendChild(grid);
+    container.appendChild(spacer);
+
+    function resize(newSize) {
+        size = newSize;
+        spacer.style.width = (size + 1) * CELL_WIDTH + 'px';
+        spacer.style.height = (size + 1) * CELL_HEIGHT + 'px';
+    }
+
+    function visibleRange(scroll, extent, cell) {
+        let first = Math.max(0, Math.floor(scroll / cell) - 1);
+        let last = Math.min(size, Math.ceil((scroll + extent) / cell));
+        return [first, last];
+    }
+
+    function fetchTile(rowTile, colTile) {
+        let key = rowTile + ':' + colTile;
+        if (requested.has(key)) {
+            return;
+        }
+        requested.add(key);
+        let url = blockUrl + (blockUrl.includes('?') ? '&' : '?') +
+            'row_start=' + rowTile * TILE_SIZE + '&rows=' + TILE_SIZE +
+            '&col_start=' + colTile * TILE_SIZE + '&cols=' + TILE_SIZE;
+        sendRequest("GET", url, function (block) {
+            tiles.set(key, block);
+            // a table that is still being downloaded grows between requests
+            if (block.size > size) {
+                resize(block.size);
+            }
+            render();
+        });
+    }
+
+    function cellText(row, col) {
+        let block = tiles.get(Math.floor(row / TILE_SIZE) + ':' + Math.floor(col / TILE_SIZE));
+        // tiles fetched before the table grew have no cells for the new rows and columns
+        if (!block || row >= block.row_start + block.cells.length || col >= block.col_start + block.col_owners.length) {
+            return null;
+        }
+        return block.cells[row - block.row_start][col - block.col_start];
+    }
+
+    function ownerText(index, isRow) {
+        let tile = Math.floor(index / TILE_SIZE);
+        let block = isRow ? tiles.get(tile + ':0') : tiles.get('0:' + tile);
+        let owners = block && (isRow ? block.row_owners : block.col_owners);
+        if (!block || index - (isRow ? block.row_start : block.col_start) >= owners.length) {
+            isRow ? fetchTile(tile, 0) : fetchTile(0, tile);
+            return '';
+        }
+        return owners[index - (isRow ? block.row_start : block.col_start)];
+    }
+
+    function addCell(text, row, col, className) {
+        let cell = document.createElement('div');
+        cell.className = className;
+        cell.textContent = text;
+        cell.style.top = row + 'px';
+        cell.style.left = col + 'px';
+        grid.appendChild(cell);
+    }
+
+    function render() {
+        let [firstRow, lastRow] = visibleRange(container.scrollTop, container.clientHeight, CELL_HEIGHT);
+        let [firstCol, lastCol] = visibleRange(container.scrollLeft, container.clientWidth, CELL_WIDTH);
+        grid.textContent = '';
+        for (let row = firstRow; row < lastRow; row++) {
+            for (let col = firstCol; col < lastCol; col++) {
+                let text = cellText(row, col);
+                if (text === null) {
+                    fetchTile(Math.floor(row / TILE_SIZE), Math.floor(col / TILE_SIZE));
+                    text = '';
+                }
+                addCell(text, (row + 1) * CELL_HEIGHT, (col + 1) * CELL_WIDTH, 'virtual-table-cell');
+            }
+        }
+        // owner names stay pinned to the top and left edges while scrolling
+        for (let col = firstCol; col < lastCol; col++) {
+            addCell(ownerText(col, false), container.scrollTop, (col + 1) * CELL_WIDTH, 'virtual-table-owner');
+        }
+        for (let row = firstRow; row < lastRow; row++) {
+            addCell(ownerText(row, true), (row + 1) * CELL_HEIGHT, container.scrollLeft, 'virtual-table-owner');
+        }
+        addCell('', container.scrollTop, container.scrollLeft, 'virtual-table-owner');
+    }
+
+    function reload() {
+        requested.clear();
+        let [firstRow, lastRow] = visibleRange(container.scrollTop, container.clientHeight, CELL_HEIGHT);
+        let [firstCol, lastCol] = visibleRange(container.scrollLeft, container.clientWidth, CELL_WIDTH);
+        for (let rowTile = Math.floor(firstRow / TILE_SIZE); rowTile * TILE_SIZE < lastRow; rowTile++) {
+            for (let colTile = Math.floor(firstCol / TILE_SIZE); colTile * TILE_SIZE < lastCol; colTile++) {
+                fetchTile(rowTile, colTile);
+            }
+        }
+    }
+
+    container.addEventListener('scroll', render);
+    window.addEventListener('resize', render);
+    resize(size);
+    render();
+    return {reload: reload};
+}
+
+function showTable(baseUrl, suspicious, size) {
+    createVirtualTable(document.querySelector('#table'), size, baseUrl + "/block?suspicious=" + suspicious);
+}
+
+function computeTable(baseUrl, suspicious, size) {
+    let progressLabel = document.querySelector('#progress');
+    progressLabel.textContent = "Вычисление...";
+
+    sendRequest("POST", baseUrl + "/jobs?suspicious=" + suspicious, function (job) {
+        let table = createVirtualTable(document.querySelector('#table'), size, "/jobs/" + job.job_id + "/block");
+        let source = new EventSource("/jobs/" + job.job_id + "/progress");
+        source.onmessage = function (event) {
+            let progress = JSON.parse(event.data);
+            progressLabel.textContent = "Вычислено пар: " + progress.done + " / " + progress.total;
+            if (progress.status === "failed") {
+                progressLabel.textContent = "Ошибка вычисления";
+            }
+            if (progress.status !== "running") {
+                source.close();
+            }
+            table.reload();
+        };
+    }, function (status) {
+        progressLabel.textContent = status === 409 ? "Решения ещё загружаются, попробуйте позже" : "Ошибка вычисления";
+    });
+}
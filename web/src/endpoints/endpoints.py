@@ -1,27 +1,48 @@
+import asyncio
+import json
 import os.path
 from typing import List, Tuple
 
 import fastapi
 import starlette
 from fastapi import APIRouter, Depends, Query, Body
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from requests.exceptions import RequestException
 from starlette import status
 from starlette.requests import Request
 from starlette.templating import Jinja2Templates
 
 from web.src.models.login_info import LoginInfo
+from web.src.models.similarity_matrix import SimilarityMatrix
 from web.src.models.solution import Solution
-from web.src.state.state import get_state, State
-from web.src.utils.diff2HtmlCompare.diff2HtmlCompare import compare
-from web.src.utils.diff_utils import create_jaro_sim_table
-from web.src.utils.diff_utils import create_similarity_table, create_cosine_similarity_table
+from web.src.state.state import get_state, get_table_key, State, STREAMING_METRIC
+from web.src.utils.async_utils import diff_executor, executor
+from web.src.utils.diff_page_utils import DiffPage
+from web.src.utils.diff_utils import TABLE_BUILDERS
 from web.src.utils.fork_utils import ParseException
+from web.src.utils.metrics_utils import PROFILE_DIR, registry
+from web.src.utils.top_pairs_utils import DEFAULT_TOP_PAIRS, TOP_PAIRS_METRICS
 
 router = APIRouter(prefix="")
 
 templates = Jinja2Templates(directory="web/resources/templates")
 
+JOB_PROGRESS_INTERVAL = 0.5
+MAX_BLOCK_SIZE = 200
+
+
+def ensure_loaded(state: State, table_key: str | None = None):
+    # only the streaming table is scored while the forks are still downloading
+    if state.is_loading() and (table_key != STREAMING_METRIC or state.path_to_file not in state.assignments):
+        raise fastapi.HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Solutions are still being downloaded")
+
+
+def ensure_profiling_enabled(profile: bool):
+    if profile and PROFILE_DIR is None:
+        raise fastapi.HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Profiling is disabled, set PROFILE_DIR"
+        )
+
 
 @router.get("/")
 async def root(state: State = Depends(get_state)):
@@ -40,8 +61,8 @@ async def get_login_page(request: Request, state: State = Depends(get_state)):
 @router.post("/login")
 async def login(request: Request, login_info: LoginInfo, state: State = Depends(get_state)):
     try:
-        state.login(login_info)
-    except (ParseException or RequestException):
+        await state.login(login_info)
+    except (ParseException, RequestException):
         return templates.TemplateResponse("index.html", {"request": request, "title": "Вход", "body": "login"})
     return fastapi.responses.JSONResponse(content="")
 
@@ -75,20 +96,42 @@ async def get_solutions(request: Request,
         solutions: List[Solution] = [state.solutions[i] for i in solution_numbers]
         first_solution = os.path.join(solutions[0].folder_with_solution, state.path_to_file)
         second_solution = os.path.join(solutions[1].folder_with_solution, state.path_to_file)
-        diff_html = compare(
-            first_solution,
-            second_solution,
-            solutions[0].owner,
-            solutions[1].owner
+        # the page is identified by the hashes of both files, which are read off the event loop
+        diff_page = await asyncio.get_running_loop().run_in_executor(
+            diff_executor, DiffPage, first_solution, second_solution, solutions[0].owner, solutions[1].owner
         )
-        return HTMLResponse(diff_html)
+        if diff_page.is_not_modified(request.headers):
+            return fastapi.responses.Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=diff_page.headers)
+        diff_html = diff_page.cached_html()
+        if diff_html is None:
+            return StreamingResponse(diff_page.stream(), media_type="text/html", headers=diff_page.headers)
+        return HTMLResponse(diff_html, headers=diff_page.headers)
     solutions: List[Tuple[int, Solution]] = [(i, solution) for i, solution in enumerate(state.solutions)]
     return templates.TemplateResponse(
         "index.html",
-        {"request": request, "title": "Решения студентов", "body": "solutions", "solutions": solutions}
+        {
+            "request": request,
+            "title": "Решения студентов",
+            "body": "solutions",
+            "solutions": solutions,
+            "assignments": list(state.assignments),
+            "path_to_file": state.path_to_file,
+            "loading": state.is_loading(),
+            "forks_downloaded": state.forks_downloaded,
+            "forks_total": state.forks_total
+        }
     )
 
 
+@router.post("/assignments/select")
+async def select_assignment(path_to_file: str = Body(..., embed=True), state: State = Depends(get_state)):
+    if not state.is_authenticated():
+        return fastapi.responses.RedirectResponse("/login", status_code=starlette.status.HTTP_302_FOUND)
+    if not state.select_assignment(path_to_file):
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown assignment")
+    return fastapi.responses.JSONResponse(content={"path_to_file": path_to_file})
+
+
 @router.get("/web/resources/css/{path}")
 async def get_css_file(path: str):
     full_path = os.path.join("web", "resources", "css", path)
@@ -107,50 +150,237 @@ async def get_css_codeformats_file(path: str):
     return fastapi.responses.FileResponse(full_path)
 
 
-@router.get("/table/similarity")
-async def get_similarity_table(request: Request, state: State = Depends(get_state)):
-    if not state.is_authenticated():
-        return fastapi.responses.RedirectResponse("/login", status_code=starlette.status.HTTP_302_FOUND)
-    if not state.similarity_table:
-        state.similarity_table = create_similarity_table(state.solutions, state.path_to_file)
-    similarity_table = state.similarity_table
-    return templates.TemplateResponse(
-        "index.html",
-        {"request": request, "title": "Вход", "body": "table", "table": similarity_table}
-    )
+@router.get("/table/jaro_similatiry", deprecated=True)
+async def get_jaro_table(request: Request):
+    # the old, misspelled address of the jaro_sim table
+    url = "/table/jaro_sim" + (f"?{request.url.query}" if request.url.query else "")
+    return fastapi.responses.RedirectResponse(url, status_code=status.HTTP_301_MOVED_PERMANENTLY)
 
 
-@router.get("/table/cosine_similarity")
-async def get_cosine_semantic_similarity_table(request: Request, state: State = Depends(get_state)):
+@router.get("/table/{metric}")
+async def get_table(request: Request, metric: str, suspicious: bool = False, state: State = Depends(get_state)):
     if not state.is_authenticated():
         return fastapi.responses.RedirectResponse("/login", status_code=starlette.status.HTTP_302_FOUND)
-    if not state.cosine_similarity_table:
-        state.cosine_similarity_table = create_cosine_similarity_table(state.solutions, state.path_to_file)
-    cosine_similarity_table = state.cosine_similarity_table
+    if metric not in TABLE_BUILDERS:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown metric")
     return templates.TemplateResponse(
         "index.html",
         {
             "request": request,
             "title": "Вход",
             "body": "table",
-            "table": cosine_similarity_table
+            "metric": metric,
+            "base_url": f"/table/{metric}",
+            "suspicious": suspicious,
+            "size": len(state.corpus),
+            "table": state.tables.get(get_table_key(metric, suspicious))
         }
     )
 
 
-@router.get("/table/jaro_similatiry")
-async def get_jaro_sim_table(request: Request, state: State = Depends(get_state)):
+def get_computed_table(state: State, metric: str, suspicious: bool) -> SimilarityMatrix:
+    if metric not in TABLE_BUILDERS:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown metric")
+    table = state.tables.get(get_table_key(metric, suspicious))
+    if table is None:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Table is not computed")
+    return table
+
+
+@router.get("/table/{metric}/pairs")
+async def get_table_pairs(metric: str,
+                          suspicious: bool = False,
+                          k: int | None = Query(default=None, ge=0),
+                          threshold: float | None = None,
+                          state: State = Depends(get_state)):
     if not state.is_authenticated():
         return fastapi.responses.RedirectResponse("/login", status_code=starlette.status.HTTP_302_FOUND)
-    if not state.jaro_sim_table:
-        state.jaro_sim_table = create_jaro_sim_table(state.solutions, state.path_to_file)
-    jaro_sim_table = state.jaro_sim_table
+    table = get_computed_table(state, metric, suspicious)
+    return fastapi.responses.JSONResponse(content={"metric": metric, "pairs": table.top_pairs(k, threshold)})
+
+
+@router.get("/table/{metric}/block")
+async def get_table_block(metric: str,
+                          suspicious: bool = False,
+                          row_start: int = Query(default=0, ge=0),
+                          rows: int = Query(default=50, ge=1, le=MAX_BLOCK_SIZE),
+                          col_start: int = Query(default=0, ge=0),
+                          cols: int = Query(default=50, ge=1, le=MAX_BLOCK_SIZE),
+                          state: State = Depends(get_state)):
+    if not state.is_authenticated():
+        return fastapi.responses.RedirectResponse("/login", status_code=starlette.status.HTTP_302_FOUND)
+    table = get_computed_table(state, metric, suspicious)
+    block = table.format_block(row_start, rows, col_start, cols)
+    return fastapi.responses.JSONResponse(content={**block, "status": "done"})
+
+
+@router.get("/table/{metric}/export")
+async def export_table(metric: str,
+                       suspicious: bool = False,
+                       format: str = Query(default="csv", regex="^(csv|json)$"),
+                       state: State = Depends(get_state)):
+    if not state.is_authenticated():
+        return fastapi.responses.RedirectResponse("/login", status_code=starlette.status.HTTP_302_FOUND)
+    table = get_computed_table(state, metric, suspicious)
+    headers = {"Content-Disposition": f'attachment; filename="{get_table_key(metric, suspicious)}.{format}"'}
+    if format == "json":
+        return fastapi.responses.JSONResponse(content=table.to_json(), headers=headers)
+    return fastapi.responses.Response(content=table.to_csv(), media_type="text/csv", headers=headers)
+
+
+@router.get("/pairs/top")
+async def get_top_pairs(metric: str = "similarity",
+                        k: int = Query(default=DEFAULT_TOP_PAIRS, ge=0),
+                        suspicious: bool = False,
+                        state: State = Depends(get_state)):
+    if not state.is_authenticated():
+        return fastapi.responses.RedirectResponse("/login", status_code=starlette.status.HTTP_302_FOUND)
+    if metric not in TOP_PAIRS_METRICS:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown metric")
+    ensure_loaded(state)
+    table = state.tables.get(get_table_key(metric, suspicious))
+    if table is not None:
+        pairs = table.top_pairs(k)
+        statistics = {"candidates": len(table.pair_scores()[0]), "scored": 0, "pruned": 0}
+    else:
+        # minhash of the candidate pairs is as slow as the search, so both run off the event loop
+        pairs, statistics = await asyncio.get_running_loop().run_in_executor(
+            executor, state.workspace.get_top_pairs, state.assignment, metric, k, suspicious
+        )
+    return fastapi.responses.JSONResponse(content={"metric": metric, "pairs": pairs, **statistics})
+
+
+@router.post("/table/{metric}/jobs")
+async def submit_table_job(metric: str,
+                           suspicious: bool = False,
+                           profile: bool = False,
+                           state: State = Depends(get_state)):
+    if not state.is_authenticated():
+        return fastapi.responses.RedirectResponse("/login", status_code=starlette.status.HTTP_302_FOUND)
+    if metric not in TABLE_BUILDERS:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown metric")
+    ensure_loaded(state, get_table_key(metric, suspicious))
+    ensure_profiling_enabled(profile)
+    job = state.submit_table_job(metric, TABLE_BUILDERS[metric], suspicious, profile)
+    return fastapi.responses.JSONResponse(content={"job_id": job.job_id, **job.progress()})
+
+
+@router.get("/course/{metric}")
+async def get_course_table(request: Request, metric: str, suspicious: bool = False, state: State = Depends(get_state)):
+    if not state.is_authenticated():
+        return fastapi.responses.RedirectResponse("/login", status_code=starlette.status.HTTP_302_FOUND)
+    if metric not in TABLE_BUILDERS:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown metric")
     return templates.TemplateResponse(
         "index.html",
         {
             "request": request,
             "title": "Вход",
             "body": "table",
-            "table": jaro_sim_table
+            "metric": metric,
+            "base_url": f"/course/{metric}",
+            "course": True,
+            "suspicious": suspicious,
+            "size": len(state.course.owners),
+            "table": state.course_tables.get(get_table_key(metric, suspicious))
         }
     )
+
+
+def get_computed_course_table(state: State, metric: str, suspicious: bool) -> SimilarityMatrix:
+    if metric not in TABLE_BUILDERS:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown metric")
+    table = state.course_tables.get(get_table_key(metric, suspicious))
+    if table is None:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Table is not computed")
+    return table
+
+
+@router.get("/course/{metric}/students")
+async def get_course_students(metric: str, suspicious: bool = False, state: State = Depends(get_state)):
+    if not state.is_authenticated():
+        return fastapi.responses.RedirectResponse("/login", status_code=starlette.status.HTTP_302_FOUND)
+    table = get_computed_course_table(state, metric, suspicious)
+    return fastapi.responses.JSONResponse(
+        content={"metric": metric, "assignments": list(state.assignments), "students": table.best_matches()}
+    )
+
+
+@router.get("/course/{metric}/block")
+async def get_course_block(metric: str,
+                           suspicious: bool = False,
+                           row_start: int = Query(default=0, ge=0),
+                           rows: int = Query(default=50, ge=1, le=MAX_BLOCK_SIZE),
+                           col_start: int = Query(default=0, ge=0),
+                           cols: int = Query(default=50, ge=1, le=MAX_BLOCK_SIZE),
+                           state: State = Depends(get_state)):
+    if not state.is_authenticated():
+        return fastapi.responses.RedirectResponse("/login", status_code=starlette.status.HTTP_302_FOUND)
+    table = get_computed_course_table(state, metric, suspicious)
+    block = table.format_block(row_start, rows, col_start, cols)
+    return fastapi.responses.JSONResponse(content={**block, "status": "done"})
+
+
+@router.post("/course/{metric}/jobs")
+async def submit_course_job(metric: str,
+                            suspicious: bool = False,
+                            profile: bool = False,
+                            state: State = Depends(get_state)):
+    if not state.is_authenticated():
+        return fastapi.responses.RedirectResponse("/login", status_code=starlette.status.HTTP_302_FOUND)
+    if metric not in TABLE_BUILDERS:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown metric")
+    ensure_loaded(state)
+    ensure_profiling_enabled(profile)
+    job = state.submit_course_job(metric, TABLE_BUILDERS[metric], suspicious, profile)
+    return fastapi.responses.JSONResponse(content={"job_id": job.job_id, **job.progress()})
+
+
+@router.get("/jobs/{job_id}/progress")
+async def stream_job_progress(job_id: str, state: State = Depends(get_state)):
+    job = state.jobs.get(job_id)
+    if job is None:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown job")
+
+    async def events():
+        while True:
+            progress = job.progress()
+            yield f"data: {json.dumps(progress)}\n\n"
+            if progress["status"] != "running":
+                break
+            await asyncio.sleep(JOB_PROGRESS_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@router.get("/jobs/{job_id}/rows")
+async def get_job_rows(job_id: str, start: int = 0, state: State = Depends(get_state)):
+    job = state.jobs.get(job_id)
+    if job is None:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown job")
+    status_name = job.status
+    ready_rows = job.ready_rows[start:]
+    rows = [{"index": row_num, "cells": job.row(row_num)} for row_num in ready_rows]
+    return fastapi.responses.JSONResponse(
+        content={"rows": rows, "next": start + len(rows), "status": status_name, "error": job.error}
+    )
+
+
+@router.get("/jobs/{job_id}/block")
+async def get_job_block(job_id: str,
+                        row_start: int = Query(default=0, ge=0),
+                        rows: int = Query(default=50, ge=1, le=MAX_BLOCK_SIZE),
+                        col_start: int = Query(default=0, ge=0),
+                        cols: int = Query(default=50, ge=1, le=MAX_BLOCK_SIZE),
+                        state: State = Depends(get_state)):
+    job = state.jobs.get(job_id)
+    if job is None:
+        raise fastapi.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown job")
+    status_name = job.status
+    block = job.block(row_start, rows, col_start, cols)
+    return fastapi.responses.JSONResponse(content={**block, "status": status_name, "error": job.error})
+
+
+@router.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
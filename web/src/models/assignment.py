@@ -0,0 +1,22 @@
+from typing import Dict, List, Tuple
+
+from web.src.models.corpus import Corpus
+from web.src.models.similarity_matrix import SimilarityMatrix
+from web.src.models.solution import Solution
+
+
+class Assignment:
+
+    def __init__(self, path_to_file: str, solutions: List[Solution], corpus: Corpus):
+        self.path_to_file = path_to_file
+        self.solutions = solutions
+        self.corpus = corpus
+        self.tables: Dict[str, SimilarityMatrix] = {}
+        self.candidate_pairs: List[Tuple[int, int]] | None = None
+
+
+class Course:
+
+    def __init__(self, assignments: List[Assignment]):
+        self.assignments = assignments
+        self.owners = sorted({owner for assignment in assignments for owner in assignment.corpus.owners})
@@ -0,0 +1,23 @@
+import hashlib
+from typing import List
+
+
+def get_content_hash(content: str) -> str:
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+class Corpus:
+
+    def __init__(self, owners: List[str], contents: List[str]):
+        self.owners = owners
+        self.contents = contents
+        self.hashes = [get_content_hash(content) for content in contents]
+
+    def add(self, owner: str, content: str):
+        # the content goes in first, so a reader that sees the owner also sees its content
+        self.contents.append(content)
+        self.hashes.append(get_content_hash(content))
+        self.owners.append(owner)
+
+    def __len__(self):
+        return len(self.owners)
@@ -1,3 +1,6 @@
+import re
+from typing import List
+
 from pydantic import BaseModel
 
 
@@ -5,3 +8,7 @@ class LoginInfo(BaseModel):
     url: str
     branch: str
     path_to_file: str
+
+    def get_paths(self) -> List[str]:
+        # several files or glob patterns may be given, separated by commas or new lines
+        return [path.strip() for path in re.split(r'[,\n]', self.path_to_file) if path.strip()]
@@ -0,0 +1,124 @@
+import csv
+import io
+from typing import List
+
+import numpy as np
+
+
+def to_fixed(numObj, digits=0):
+    return f"{numObj:.{digits}f}"
+
+
+def format_row(owner: str, row_num: int, values: np.ndarray, col_start: int = 0) -> List[str]:
+    row = [owner]
+    for col_num, value in enumerate(values, start=col_start):
+        if row_num == col_num or np.isnan(value):
+            row.append("")
+        else:
+            row.append(to_fixed(value, digits=2))
+    return row
+
+
+def format_block(owners: List[str], values: np.ndarray, row_start: int, rows: int, col_start: int, cols: int) -> dict:
+    row_end, col_end = min(row_start + rows, len(owners)), min(col_start + cols, len(owners))
+    return {
+        "size": len(owners),
+        "row_start": row_start,
+        "col_start": col_start,
+        "row_owners": owners[row_start:row_end],
+        "col_owners": owners[col_start:col_end],
+        "cells": [
+            format_row(owners[row_num], row_num, values[row_num, col_start:col_end], col_start)[1:]
+            for row_num in range(row_start, row_end)
+        ]
+    }
+
+
+class SimilarityMatrix:
+
+    def __init__(self, owners: List[str], values: np.ndarray, higher_is_similar: bool = True):
+        self.owners = owners
+        self.values = np.asarray(values, dtype=np.float32)
+        # distances are more suspicious the lower they are
+        self.higher_is_similar = higher_is_similar
+
+    def __len__(self):
+        return len(self.owners)
+
+    def format_row(self, row_num: int) -> List[str]:
+        return format_row(self.owners[row_num], row_num, self.values[row_num])
+
+    def format_block(self, row_start: int, rows: int, col_start: int, cols: int) -> dict:
+        return format_block(self.owners, self.values, row_start, rows, col_start, cols)
+
+    def format_table(self) -> List[List[str]]:
+        return [[""] + self.owners] + [self.format_row(row_num) for row_num in range(len(self))]
+
+    def pair_scores(self):
+        # a pair is scored once, by the more similar of its two directions
+        rows, cols = np.triu_indices(len(self), k=1)
+        forward, backward = self.values[rows, cols], self.values[cols, rows]
+        scores = np.fmax(forward, backward) if self.higher_is_similar else np.fmin(forward, backward)
+        known = ~np.isnan(scores)
+        return rows[known], cols[known], scores[known]
+
+    def top_pairs(self, k: int | None = None, threshold: float | None = None) -> List[dict]:
+        rows, cols, scores = self.pair_scores()
+        if threshold is not None:
+            passed = scores >= threshold if self.higher_is_similar else scores <= threshold
+            rows, cols, scores = rows[passed], cols[passed], scores[passed]
+        keys = -scores if self.higher_is_similar else scores
+        if k is not None and k < len(keys):
+            # only the k best are sorted
+            best = np.argpartition(keys, k)[:k] if k > 0 else np.empty(0, dtype=int)
+            order = best[np.argsort(keys[best], kind="stable")]
+        else:
+            order = np.argsort(keys, kind="stable")
+        return [
+            {"first": self.owners[rows[num]], "second": self.owners[cols[num]], "score": float(scores[num])}
+            for num in order
+        ]
+
+    def best_matches(self) -> List[dict]:
+        values = self.values.copy()
+        np.fill_diagonal(values, np.nan)
+        matches = []
+        for row_num, owner in enumerate(self.owners):
+            row = values[row_num]
+            if np.isnan(row).all():
+                continue
+            col_num = int(np.nanargmax(row) if self.higher_is_similar else np.nanargmin(row))
+            matches.append({"owner": owner, "closest": self.owners[col_num], "score": float(row[col_num])})
+        return sorted(matches, key=lambda match: match["score"], reverse=self.higher_is_similar)
+
+    def to_json(self) -> dict:
+        return {
+            "owners": self.owners,
+            "higher_is_similar": self.higher_is_similar,
+            "values": [[None if np.isnan(value) else float(value) for value in row] for row in self.values]
+        }
+
+    def to_csv(self) -> str:
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow([""] + self.owners)
+        for owner, row in zip(self.owners, self.values):
+            writer.writerow([owner] + ["" if np.isnan(value) else f"{value:.6g}" for value in row])
+        return output.getvalue()
+
+
+def aggregate_matrices(owners: List[str], matrices: List[SimilarityMatrix]) -> SimilarityMatrix:
+    # a pair is scored by its mean over the files both students have
+    index = {owner: num for num, owner in enumerate(owners)}
+    sums = np.zeros((len(owners), len(owners)))
+    counts = np.zeros((len(owners), len(owners)))
+    for matrix in matrices:
+        positions = [index[owner] for owner in matrix.owners]
+        block = np.ix_(positions, positions)
+        known = ~np.isnan(matrix.values)
+        np.fill_diagonal(known, False)
+        sums[block] += np.where(known, matrix.values, 0)
+        counts[block] += known
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = np.where(counts > 0, sums / counts, np.nan)
+    return SimilarityMatrix(owners, values, all(matrix.higher_is_similar for matrix in matrices))
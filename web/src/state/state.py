@@ -1,58 +1,421 @@
+import asyncio
+import logging
 import os
 import shutil
+import uuid
+from collections import OrderedDict
+from contextlib import aclosing
 from pathlib import Path
+from typing import Dict, List, Tuple
 
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from web.src.models.assignment import Assignment, Course
+from web.src.models.corpus import Corpus, get_content_hash
 from web.src.models.login_info import LoginInfo
+from web.src.models.similarity_matrix import SimilarityMatrix, aggregate_matrices
 from web.src.models.solution import Solution
-from web.src.utils.fork_utils import parse_url, download_solutions
+from web.src.utils.async_utils import executor
+from web.src.utils.diff_utils import find_assignment_paths, load_solution_content
+from web.src.utils.diff_utils import sequence_matcher_ratio
+from web.src.utils.fork_utils import parse_url, get_fork_urls, iter_downloaded_solutions
+from web.src.utils.job_utils import Job, JobManager, StreamingJob
+from web.src.utils.minhash_utils import find_candidate_pairs
+from web.src.utils.store_utils import ScoreStore
+from web.src.utils.top_pairs_utils import find_top_pairs
+
+# the table that is scored while the forks are still downloading
+STREAMING_METRIC = "similarity"
+
+logger = logging.getLogger(__name__)
+
+WORKSPACES_FOLDER = os.environ.get("WORKSPACES_FOLDER", "tmp")
+SESSION_MEMORY_BYTES = int(os.environ.get("SESSION_MEMORY_BYTES", 1 << 30))
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", 1000))
+SESSION_COOKIE = "session_id"
+
+
+def get_table_key(metric: str, suspicious: bool = False) -> str:
+    return f"{metric}:suspicious" if suspicious else metric
+
+
+WorkspaceKey = Tuple[str, str, Tuple[str, ...]]
+
+
+def get_workspace_key(login_info: LoginInfo) -> WorkspaceKey:
+    return login_info.url, login_info.branch, tuple(login_info.get_paths())
+
+
+class Workspace:
+    # the forks of one repository, branch and set of files; every session that opened them shares it
+
+    def __init__(self,
+                 folder: str,
+                 score_store: ScoreStore,
+                 keep_folder: bool = False,
+                 key: WorkspaceKey | None = None):
+        self.folder = folder
+        self.score_store = score_store
+        self.keep_folder = keep_folder
+        self.key = key
+        self.sessions = 0
+        self.jobs = JobManager()
+        self.loading: asyncio.Task | None = None
+        self.forks_total = 0
+        self.forks_downloaded = 0
+        self.set_assignments({})
+
+    async def download(self, username: str, repository_name: str, branch: str, patterns: List[str]):
+        Path(self.folder).mkdir(parents=True, exist_ok=True)
+        forks = await get_fork_urls(username, repository_name)
+        if self.is_loading():
+            # another session started the same sync while the forks were listed
+            return
+        # a sync starts over: unchanged clones are only fetched, and their scores come from the score store
+        self.set_assignments({})
+        self.jobs.clear()
+        self.forks_total = len(forks)
+        self.forks_downloaded = 0
+        self.loading = asyncio.create_task(self.load_solutions(forks, branch, patterns))
+
+    async def load_solutions(self, forks: List[Tuple[str, str]], branch: str, patterns: List[str]):
+        # every fork is read and scored as soon as its clone finishes, instead of after all of them;
+        # clones run on the event loop, reading and scoring run in the computation threads
+        loop = asyncio.get_running_loop()
+        assignments = self.assignments
+        streaming_jobs: Dict[str, StreamingJob] = {}
+        try:
+            async with aclosing(iter_downloaded_solutions(forks, branch, self.folder, patterns)) as solutions:
+                async for solution in solutions:
+                    for path_to_file in find_assignment_paths([solution], patterns):
+                        if path_to_file not in assignments:
+                            assignment = Assignment(path_to_file, [], Corpus([], []))
+                            streaming_jobs[path_to_file] = StreamingJob(
+                                STREAMING_METRIC, assignment.corpus, sequence_matcher_ratio, symmetric=False,
+                                store=self.score_store
+                            )
+                            self.jobs.add(STREAMING_METRIC, assignment.corpus, streaming_jobs[path_to_file])
+                            assignments[path_to_file] = assignment
+                        assignment = assignments[path_to_file]
+                        try:
+                            content = await loop.run_in_executor(
+                                executor, load_solution_content, solution, path_to_file
+                            )
+                        except OSError as exception:
+                            # one unreadable file is left out, the other files and forks keep loading
+                            logger.warning("skipping %s of %s: %s", path_to_file, solution.owner, exception)
+                            continue
+                        assignment.solutions.append(solution)
+                        job = streaming_jobs[path_to_file]
+                        await loop.run_in_executor(executor, job.add_document, solution.owner, content)
+                    self.forks_downloaded += 1
+        except Exception as exception:
+            for job in streaming_jobs.values():
+                job.error = str(exception)
+            raise
+        for path_to_file, job in streaming_jobs.items():
+            assignments[path_to_file].tables[STREAMING_METRIC] = job.finish()
+            self.jobs.finish(STREAMING_METRIC, assignments[path_to_file].corpus)
+        self.course = Course(list(assignments.values()))
+
+    def is_loading(self) -> bool:
+        return self.loading is not None and not self.loading.done()
+
+    def stop_loading(self):
+        # cancelling the task also kills the git processes that are still running
+        if self.loading is not None:
+            self.loading.cancel()
+            self.loading = None
+
+    def release(self):
+        self.stop_loading()
+        self.set_assignments({})
+        self.jobs.clear()
+        if not self.keep_folder:
+            shutil.rmtree(self.folder, ignore_errors=True)
+
+    def set_assignments(self, assignments: Dict[str, Assignment]):
+        self.assignments = assignments
+        self.course = Course(list(assignments.values()))
+        self.course_tables: Dict[str, SimilarityMatrix] = {}
+
+    def memory_size(self) -> int:
+        assignments = list(self.assignments.values())
+        tables = [table for assignment in assignments for table in assignment.tables.values()]
+        tables += self.course_tables.values()
+        size = sum(table.values.nbytes for table in tables)
+        size += sum(job.matrix.nbytes for job in list(self.jobs.jobs.values()))
+        size += sum(len(content) for assignment in assignments for content in assignment.corpus.contents)
+        return size
+
+    def get_candidate_pairs(self, assignment: Assignment) -> List[Tuple[int, int]]:
+        if assignment.candidate_pairs is None:
+            assignment.candidate_pairs = find_candidate_pairs(assignment.corpus.contents)
+        return assignment.candidate_pairs
+
+    def get_top_pairs(self, assignment: Assignment, metric: str, k: int, suspicious: bool) -> Tuple[List[dict], dict]:
+        pairs = self.get_candidate_pairs(assignment) if suspicious else None
+        return find_top_pairs(assignment.corpus, metric, k, pairs)
+
+    def build_table(self, assignment: Assignment, builder, suspicious: bool, progress: Job | None = None):
+        pairs = self.get_candidate_pairs(assignment) if suspicious else None
+        return builder(assignment.corpus, pairs=pairs, store=self.score_store, progress=progress)
+
+    def submit_table_job(self,
+                         assignment: Assignment,
+                         metric: str,
+                         builder,
+                         suspicious: bool = False,
+                         profile: bool = False) -> Job:
+        table_key = get_table_key(metric, suspicious)
+
+        def build(corpus: Corpus, progress: Job):
+            return self.build_table(assignment, builder, suspicious, progress)
+
+        def store_table(job: Job):
+            assignment.tables[table_key] = job.table
+
+        return self.jobs.submit(table_key, build, assignment.corpus, store_table, profile)
+
+    def submit_course_job(self, metric: str, builder, suspicious: bool = False, profile: bool = False) -> Job:
+        course = self.course
+        table_key = get_table_key(metric, suspicious)
+
+        def build(course: Course, progress: Job):
+            # tables already built for a file are reused, the missing ones are built in this one pass
+            progress.total = len(course.assignments)
+            tables = []
+            for assignment in course.assignments:
+                if table_key not in assignment.tables:
+                    assignment.tables[table_key] = self.build_table(assignment, builder, suspicious)
+                tables.append(assignment.tables[table_key])
+                progress.done += 1
+            return aggregate_matrices(course.owners, tables)
+
+        def store_table(job: Job):
+            if course is self.course:
+                self.course_tables[table_key] = job.table
+
+        return self.jobs.submit("course:" + table_key, build, course, store_table, profile)
 
 
 class State:
+    # what one browser session sees: the workspace it opened and the file selected in it
 
-    def __init__(self):
-        self.folder = "tmp"
-        # path_to_folder = Path(self.folder)
-        # if path_to_folder.exists():
-        #     shutil.rmtree(path_to_folder, ignore_errors=True)
-        self.path_to_file = ""
-        self.solutions = []
-        self.similarity_table = []
-        self.cosine_similarity_table = []
-        self.jaro_sim_table = []
-
-        self.logged_in = True
-        self.path_to_file = "task06-fp-yat/Yat.hs"
-        self.solutions = [Solution(f, os.path.join(self.folder, f)) for f in os.listdir(self.folder)]
-
-    def login(self, login_info: LoginInfo):
-        path_to_folder = Path(self.folder)
-        if not path_to_folder.exists():
-            path_to_folder.mkdir()
-        username, repository_name = parse_url(login_info.url, "https://github.com/")
-        solutions = download_solutions(username, repository_name, login_info.branch, state.folder)
-        self.path_to_file = login_info.path_to_file
-        self.solutions = list(
-            filter(
-                lambda s: Path(os.path.join(s.folder_with_solution, self.path_to_file)).is_file(),
-                solutions
-            )
-        )
-        self.logged_in = True
+    def __init__(self, session_id: str, manager: "StateManager", workspace: Workspace | None = None):
+        self.session_id = session_id
+        self.manager = manager
+        self.workspace = workspace or Workspace("", manager.score_store, keep_folder=True)
+        self.selected_file = ""
+        self.logged_in = workspace is not None
+
+    @property
+    def assignments(self) -> Dict[str, Assignment]:
+        return self.workspace.assignments
+
+    @property
+    def path_to_file(self) -> str:
+        # files keep arriving while the forks download, the first one is shown until another is selected
+        if self.selected_file in self.assignments:
+            return self.selected_file
+        return next(iter(self.assignments), "")
+
+    @property
+    def assignment(self) -> Assignment:
+        if self.path_to_file not in self.assignments:
+            return Assignment(self.path_to_file, [], Corpus([], []))
+        return self.assignments[self.path_to_file]
+
+    @property
+    def solutions(self) -> List[Solution]:
+        return self.assignment.solutions
+
+    @property
+    def corpus(self) -> Corpus:
+        return self.assignment.corpus
+
+    @property
+    def tables(self) -> Dict[str, SimilarityMatrix]:
+        return self.assignment.tables
+
+    @property
+    def course(self) -> Course:
+        return self.workspace.course
+
+    @property
+    def course_tables(self) -> Dict[str, SimilarityMatrix]:
+        return self.workspace.course_tables
+
+    @property
+    def jobs(self) -> JobManager:
+        return self.workspace.jobs
+
+    @property
+    def forks_total(self) -> int:
+        return self.workspace.forks_total
+
+    @property
+    def forks_downloaded(self) -> int:
+        return self.workspace.forks_downloaded
+
+    async def login(self, login_info: LoginInfo):
+        await self.manager.login(self, login_info)
+
+    def is_loading(self) -> bool:
+        return self.workspace.is_loading()
 
     def is_authenticated(self):
         return self.logged_in
 
     def clear(self):
-        shutil.rmtree(self.folder, ignore_errors=True)
-        self.solutions = []
-        self.similarity_table = []
-        self.cosine_similarity_table = []
-        self.jaro_sim_table = []
-        self.logged_in = False
+        self.manager.logout(self)
+
+    def select_assignment(self, path_to_file: str) -> bool:
+        if path_to_file not in self.assignments:
+            return False
+        self.selected_file = path_to_file
+        return True
+
+    def submit_table_job(self, metric: str, builder, suspicious: bool = False, profile: bool = False) -> Job:
+        return self.workspace.submit_table_job(self.assignment, metric, builder, suspicious, profile)
+
+    def submit_course_job(self, metric: str, builder, suspicious: bool = False, profile: bool = False) -> Job:
+        return self.workspace.submit_course_job(metric, builder, suspicious, profile)
+
+
+class StateManager:
+
+    def __init__(self, memory_budget: int = SESSION_MEMORY_BYTES, max_sessions: int = MAX_SESSIONS):
+        self.memory_budget = memory_budget
+        self.max_sessions = max_sessions
+        self.sessions: OrderedDict[str, State] = OrderedDict()
+        # least recently used first, like the sessions
+        self.workspaces: OrderedDict[WorkspaceKey, Workspace] = OrderedDict()
+        self.score_store = ScoreStore()
+
+    def get(self, session_id: str) -> State:
+        # a new session starts logged out, so it is sent to the login page
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = State(session_id, self)
+            self.sessions[session_id] = session
+        self.sessions.move_to_end(session_id)
+        if self.is_registered(session.workspace):
+            self.workspaces.move_to_end(session.workspace.key)
+        self.evict(session)
+        return session
+
+    def is_registered(self, workspace: Workspace) -> bool:
+        return workspace.key is not None and self.workspaces.get(workspace.key) is workspace
+
+    async def login(self, session: State, login_info: LoginInfo):
+        username, repository_name = parse_url(login_info.url, "https://github.com/")
+        key = get_workspace_key(login_info)
+        workspace = self.workspaces.get(key)
+        is_new = workspace is None
+        if is_new:
+            # sessions that open the same files of the same repository share one download and one corpus
+            folder = os.path.join(WORKSPACES_FOLDER, get_content_hash(repr(key)))
+            workspace = Workspace(folder, self.score_store, key=key)
+            self.workspaces[key] = workspace
+        # the session holds the workspace while the forks are listed, so it is not evicted in the meantime
+        self.attach(session, workspace)
+        if workspace.is_loading() or workspace.sessions > 1:
+            # other sessions keep the tables, jobs and solution numbers they are looking at
+            return
+        # a workspace no one else holds is synced again, which also retries a download that failed
+        try:
+            await workspace.download(username, repository_name, login_info.branch, login_info.get_paths())
+        except Exception:
+            if is_new:
+                self.logout(session)
+            raise
+
+    def logout(self, session: State):
+        self.detach(session)
+        session.workspace = Workspace("", self.score_store, keep_folder=True)
+        session.selected_file = ""
+        session.logged_in = False
+
+    def attach(self, session: State, workspace: Workspace):
+        if session.workspace is not workspace:
+            self.detach(session)
+            workspace.sessions += 1
+            session.workspace = workspace
+        session.selected_file = ""
+        session.logged_in = True
+
+    def detach(self, session: State):
+        # a clone folder is removed only when the last session that uses it is gone;
+        # the empty workspace of a logged out session is not counted
+        workspace = session.workspace
+        if not self.is_registered(workspace):
+            return
+        workspace.sessions -= 1
+        if workspace.sessions == 0:
+            self.release(workspace)
+
+    def release(self, workspace: Workspace):
+        del self.workspaces[workspace.key]
+        workspace.release()
+
+    def memory_size(self) -> int:
+        return sum(workspace.memory_size() for workspace in self.workspaces.values())
+
+    def evict(self, current: State):
+        # idle sessions past the limit are dropped, least recently used first
+        for session_id in list(self.sessions)[:max(0, len(self.sessions) - self.max_sessions)]:
+            session = self.sessions[session_id]
+            if session is not current:
+                self.detach(session)
+                del self.sessions[session_id]
+
+        # the memory is held by the workspaces, so the least recently used ones are released until the rest fit;
+        # their sessions are logged out, and the workspace of the current session is kept
+        sizes = [(workspace, workspace.memory_size()) for workspace in self.workspaces.values()]
+        total = sum(size for _, size in sizes)
+        for workspace, size in sizes:
+            if total <= self.memory_budget:
+                return
+            if workspace is current.workspace:
+                continue
+            for session in list(self.sessions.values()):
+                if session.workspace is workspace:
+                    self.logout(session)
+            if self.is_registered(workspace):
+                self.release(workspace)
+            total -= size
+
+
+state_manager = StateManager()
+
+
+class SessionCookieMiddleware:
+    # gives every browser a session id, which selects its State
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        session_id = Request(scope).cookies.get(SESSION_COOKIE)
+        is_new = session_id is None
+        if is_new:
+            session_id = uuid.uuid4().hex
+        scope.setdefault("state", {})["session_id"] = session_id
 
+        async def send_with_cookie(message: Message):
+            if is_new and message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("set-cookie", f"{SESSION_COOKIE}={session_id}; HttpOnly; Path=/; SameSite=lax")
+            await send(message)
 
-state = State()
+        await self.app(scope, receive, send_with_cookie)
 
 
-def get_state():
-    return state
+def get_state(request: Request) -> State:
+    return state_manager.get(request.state.session_id)
@@ -0,0 +1,14 @@
+import concurrent.futures
+import os
+
+from web.src.utils.metrics_utils import registry
+
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=int(os.environ.get("COMPUTATION_THREADS", 4)))
+# the executor has no public queue length, its work queue is read directly
+registry.gauge("computation_queue_depth", "Tasks waiting for a computation thread").set_function(
+    executor._work_queue.qsize
+)
+# diff pages are rendered apart from the table jobs, so opening a diff does not wait for a whole table to be built
+diff_executor = concurrent.futures.ThreadPoolExecutor(max_workers=int(os.environ.get("DIFF_THREADS", 2)))
+registry.gauge("diff_queue_depth", "Diff pages waiting for a diff thread").set_function(diff_executor._work_queue.qsize)
+
@@ -0,0 +1,46 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable
+
+
+class LRUCache:
+
+    def __init__(self, max_bytes: int, size_of=len):
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.items: OrderedDict[Hashable, object] = OrderedDict()
+        self.sizes = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key: Hashable, value):
+        size = self.size_of(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.items:
+                self.size -= self.sizes.pop(key)
+                del self.items[key]
+            self.items[key] = value
+            self.sizes[key] = size
+            self.size += size
+            while self.size > self.max_bytes:
+                evicted_key, _ = self.items.popitem(last=False)
+                self.size -= self.sizes.pop(evicted_key)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.sizes.clear()
+            self.size = 0
@@ -22,6 +22,7 @@
 
 import difflib
 import io
+import os
 import sys
 
 import pygments
@@ -119,6 +120,32 @@ class DefaultLexer(RegexLexer):
     }
 
 
+def get_diff_line_nos(diffs):
+    """
+    Builds the line number column of both sides in a single pass over the diffs.
+    """
+    left_linenos = []
+    right_linenos = []
+    for (left_no, left_line), (right_no, right_line), change in diffs:
+        if change:
+            if isinstance(left_no, int) and isinstance(right_no, int):
+                left_linenos.append('<span class="lineno_q lineno_leftchange">' + str(left_no) + "</span>")
+                right_linenos.append('<span class="lineno_q lineno_rightchange">' + str(right_no) + "</span>")
+            elif isinstance(left_no, int) and not isinstance(right_no, int):
+                left_linenos.append('<span class="lineno_q lineno_leftdel">' + str(left_no) + "</span>")
+                right_linenos.append('<span class="lineno_q lineno_rightdel">  </span>')
+            elif not isinstance(left_no, int) and isinstance(right_no, int):
+                left_linenos.append('<span class="lineno_q lineno_leftadd">  </span>')
+                right_linenos.append('<span class="lineno_q lineno_rightadd">' + str(right_no) + "</span>")
+            else:
+                left_linenos.append(None)
+                right_linenos.append(None)
+        else:
+            left_linenos.append('<span class="lineno_q">' + str(left_no) + "</span>")
+            right_linenos.append('<span class="lineno_q">' + str(right_no) + "</span>")
+    return left_linenos, right_linenos
+
+
 class DiffHtmlFormatter(HtmlFormatter):
     """
     Formats a single source file with pygments and adds diff highlights based on the 
@@ -127,42 +154,20 @@ class DiffHtmlFormatter(HtmlFormatter):
     isLeft = False
     diffs = None
 
-    def __init__(self, isLeft, diffs, *args, **kwargs):
+    def __init__(self, isLeft, diffs, *args, diffLineNos=None, **kwargs):
         self.isLeft = isLeft
         self.diffs = diffs
+        self.diffLineNos = diffLineNos
         super(DiffHtmlFormatter, self).__init__(*args, **kwargs)
 
     def wrap(self, source, outfile):
         return self._wrap_code(source)
 
     def getDiffLineNos(self):
-        retlinenos = []
-        for idx, ((left_no, left_line), (right_no, right_line), change) in enumerate(self.diffs):
-            no = None
-            if self.isLeft:
-                if change:
-                    if isinstance(left_no, int) and isinstance(right_no, int):
-                        no = '<span class="lineno_q lineno_leftchange">' + str(left_no) + "</span>"
-                    elif isinstance(left_no, int) and not isinstance(right_no, int):
-                        no = '<span class="lineno_q lineno_leftdel">' + str(left_no) + "</span>"
-                    elif not isinstance(left_no, int) and isinstance(right_no, int):
-                        no = '<span class="lineno_q lineno_leftadd">  </span>'
-                else:
-                    no = '<span class="lineno_q">' + str(left_no) + "</span>"
-            else:
-                if change:
-                    if isinstance(left_no, int) and isinstance(right_no, int):
-                        no = '<span class="lineno_q lineno_rightchange">' + str(right_no) + "</span>"
-                    elif isinstance(left_no, int) and not isinstance(right_no, int):
-                        no = '<span class="lineno_q lineno_rightdel">  </span>'
-                    elif not isinstance(left_no, int) and isinstance(right_no, int):
-                        no = '<span class="lineno_q lineno_rightadd">' + str(right_no) + "</span>"
-                else:
-                    no = '<span class="lineno_q">' + str(right_no) + "</span>"
-
-            retlinenos.append(no)
-
-        return retlinenos
+        if self.diffLineNos is None:
+            self.diffLineNos = get_diff_line_nos(self.diffs)
+        left_linenos, right_linenos = self.diffLineNos
+        return left_linenos if self.isLeft else right_linenos
 
     def _wrap_code(self, source):
         source = list(source)
@@ -260,6 +265,22 @@ class DiffHtmlFormatter(HtmlFormatter):
         yield 0, '</td></tr></table>'
 
 
+_lexers = {}
+
+
+def get_lexer(filename, code):
+    """
+    Guessing a lexer scores every known lexer, so the result is cached by file extension.
+    """
+    extension = os.path.splitext(filename)[1]
+    if extension not in _lexers:
+        try:
+            _lexers[extension] = guess_lexer_for_filename(filename, code)
+        except pygments.util.ClassNotFound:
+            _lexers[extension] = DefaultLexer()
+    return _lexers[extension]
+
+
 class Diff(object):
     """
     Manages a pair of source files and generates a single html diff page comparing
@@ -271,7 +292,7 @@ class Diff(object):
     resetCssFile = "web/resources/css/reset.css"
     jqueryJsFile = "web/resources/js/jquery.min.js"
 
-    def __init__(self, from_file: str, to_file: str, first_owner: str, second_owner: str):
+    def __init__(self, from_file: str, to_file: str, first_owner: str, second_owner: str, mdiff=None):
         self.from_file = from_file
         self.to_file = to_file
         self.first_owner = first_owner
@@ -279,10 +300,11 @@ class Diff(object):
         self.diffs = []
         self.html_contents = ""
         self.lexer = None
+        self.mdiff = mdiff or difflib._mdiff
 
         def read_file(filename: str):
             try:
-                with open(filename, encoding="utf-8") as file:
+                with open(filename, encoding="utf-8", errors="replace") as file:
                     lines = file.readlines()
                     code = "".join(lines)
                     return lines, code
@@ -293,52 +315,61 @@ class Diff(object):
         self.from_lines, self.left_code = read_file(self.from_file)
         self.to_lines, self.right_code = read_file(self.to_file)
 
-    def format(self):
+    def iter_format(self):
+        """
+        Yields the page in chunks: the page head goes out before either side is highlighted.
+        """
         def expand_tabs(line):
             line = line.replace(' ', '\0')
             line = line.expandtabs(8)
             line = line.replace(' ', '\t')
             return line.replace('\0', ' ').rstrip('\n')
 
-        self.from_lines = [expand_tabs(line) for line in self.from_lines]
-        self.to_lines = [expand_tabs(line) for line in self.to_lines]
-
-        self.diffs = list(
-            difflib._mdiff(self.from_lines, self.to_lines, linejunk=None, charjunk=difflib.IS_CHARACTER_JUNK)
-        )
-
-        fields = ((self.left_code, True, self.from_file),
-                  (self.right_code, False, self.to_file))
-
-        code_contents = []
-        for (code, isLeft, filename) in fields:
-            diff_html_formatter = DiffHtmlFormatter(isLeft, self.diffs, nobackground=False, linenos=True)
-
-            try:
-                self.lexer = guess_lexer_for_filename(self.to_file, code)
-            except pygments.util.ClassNotFound:
-                self.lexer = DefaultLexer()
-
-            formatted = pygments.highlight(code, self.lexer, diff_html_formatter)
-            code_contents.append(formatted)
-
         answers = {
             "html_title": "Сравнение",
             "reset_css": self.resetCssFile,
             "pygments_css": self.pygmentsCssFile % "vs",
             "diff_css": self.diffCssFile,
             "page_title": self.first_owner + " VS " + self.second_owner,
-            "original_code": code_contents[0],
-            "modified_code": code_contents[1],
+            "original_code": "%(original_code)s",
+            "modified_code": "%(modified_code)s",
             "jquery_js": self.jqueryJsFile,
             "diff_js": self.diffJsFile,
             "page_width": "page-full-width"
         }
+        head, rest = (HTML_TEMPLATE % answers).split("%(original_code)s")
+        middle, tail = rest.split("%(modified_code)s")
+        yield head
+
+        self.from_lines = [expand_tabs(line) for line in self.from_lines]
+        self.to_lines = [expand_tabs(line) for line in self.to_lines]
+
+        self.diffs = list(
+            self.mdiff(self.from_lines, self.to_lines, linejunk=None, charjunk=difflib.IS_CHARACTER_JUNK)
+        )
+        diff_line_nos = get_diff_line_nos(self.diffs)
+        self.lexer = get_lexer(self.to_file, self.right_code)
 
-        self.html_contents = HTML_TEMPLATE % answers
+        fields = ((self.left_code, True, middle),
+                  (self.right_code, False, tail))
 
+        for (code, isLeft, separator) in fields:
+            diff_html_formatter = DiffHtmlFormatter(
+                isLeft, self.diffs, diffLineNos=diff_line_nos, nobackground=False, linenos=True
+            )
+            yield pygments.highlight(code, self.lexer, diff_html_formatter)
+            yield separator
 
-def compare(from_file, to_file, first_owner, second_owner):
-    code_diff = Diff(from_file, to_file, first_owner, second_owner)
+    def format(self):
+        self.html_contents = "".join(self.iter_format())
+
+
+def compare(from_file, to_file, first_owner, second_owner, mdiff=None):
+    code_diff = Diff(from_file, to_file, first_owner, second_owner, mdiff)
     code_diff.format()
     return code_diff.html_contents
+
+
+def compare_stream(from_file, to_file, first_owner, second_owner, mdiff=None):
+    code_diff = Diff(from_file, to_file, first_owner, second_owner, mdiff)
+    return code_diff.iter_format()
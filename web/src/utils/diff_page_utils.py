@@ -0,0 +1,146 @@
+import difflib
+import os
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterator, List, Mapping, Tuple
+
+from web.src.models.corpus import get_content_hash
+from web.src.utils.async_utils import diff_executor
+from web.src.utils.cache_utils import LRUCache
+from web.src.utils.diff2HtmlCompare.diff2HtmlCompare import compare_stream
+from web.src.utils.line_diff_utils import histogram_mdiff
+from web.src.utils.metrics_utils import register_cache, registry
+
+DIFF_CACHE_BYTES = int(os.environ.get("DIFF_CACHE_BYTES", 64 * 1024 * 1024))
+# "difflib", "histogram" or "auto" (histogram only for files of at least LARGE_FILE_LINES lines)
+DIFF_ENGINE = os.environ.get("DIFF_ENGINE", "auto")
+LARGE_FILE_LINES = int(os.environ.get("LARGE_FILE_LINES", 2000))
+
+DIFF_ENGINES = {
+    "difflib": difflib._mdiff,
+    "histogram": histogram_mdiff
+}
+
+diff_cache = LRUCache(DIFF_CACHE_BYTES, size_of=lambda html: len(html.encode("utf-8")))
+register_cache("diff", diff_cache)
+diff_render_seconds = registry.histogram("diff_render_seconds", "Time spent diffing and highlighting a diff page")
+
+
+class DiffRender:
+    # the chunks of one page being rendered, read by every request for that page while it is in flight
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.finished = False
+        self.error: Exception | None = None
+        self.condition = threading.Condition()
+
+    def add(self, chunk: str):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, error: Exception | None = None):
+        with self.condition:
+            self.finished = True
+            self.error = error
+            self.condition.notify_all()
+
+    def follow(self) -> Iterator[str]:
+        position = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: len(self.chunks) > position or self.finished)
+                chunks, finished = self.chunks[position:], self.finished
+            position += len(chunks)
+            yield from chunks
+            if finished:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+diff_renders: Dict[str, DiffRender] = {}
+diff_renders_lock = threading.Lock()
+
+
+def get_file_info(path: str) -> Tuple[str, int]:
+    with open(path, encoding="utf-8", errors="replace") as file:
+        content = file.read()
+    return get_content_hash(content), content.count("\n") + 1
+
+
+def choose_diff_engine(line_count: int) -> str:
+    if DIFF_ENGINE in DIFF_ENGINES:
+        return DIFF_ENGINE
+    return "histogram" if line_count >= LARGE_FILE_LINES else "difflib"
+
+
+class DiffPage:
+
+    def __init__(self, first_path: str, second_path: str, first_owner: str, second_owner: str):
+        first_hash, first_lines = get_file_info(first_path)
+        second_hash, second_lines = get_file_info(second_path)
+        first = (first_hash, first_owner, first_path)
+        second = (second_hash, second_owner, second_path)
+        # (j, i) is served as the mirror of (i, j), so both orders share one rendering
+        if second[:2] < first[:2]:
+            first, second = second, first
+        self.first_hash, self.first_owner, self.first_path = first
+        self.second_hash, self.second_owner, self.second_path = second
+        self.engine = choose_diff_engine(max(first_lines, second_lines))
+        self.etag = '"' + get_content_hash(
+            repr((first[:2], second[:2], os.path.basename(self.second_path), self.engine))
+        ) + '"'
+        self.modified_at = int(max(os.path.getmtime(first_path), os.path.getmtime(second_path)))
+
+    @property
+    def headers(self) -> dict:
+        return {
+            "ETag": self.etag,
+            "Last-Modified": formatdate(self.modified_at, usegmt=True),
+            "Cache-Control": "no-cache"
+        }
+
+    def is_not_modified(self, request_headers: Mapping[str, str]) -> bool:
+        if "if-none-match" in request_headers:
+            etags = [etag.strip().removeprefix("W/") for etag in request_headers["if-none-match"].split(",")]
+            return self.etag in etags or "*" in etags
+        if "if-modified-since" in request_headers:
+            try:
+                return parsedate_to_datetime(request_headers["if-modified-since"]).timestamp() >= self.modified_at
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def cached_html(self) -> str | None:
+        return diff_cache.get(self.etag)
+
+    def stream(self) -> Iterator[str]:
+        # concurrent requests for the same page follow one render instead of starting their own
+        with diff_renders_lock:
+            render = diff_renders.get(self.etag)
+            if render is None:
+                render = diff_renders[self.etag] = DiffRender()
+                diff_executor.submit(self.render, render)
+        return render.follow()
+
+    def render(self, render: DiffRender):
+        # the page is rendered at its own pace, so a slow or gone client does not hold up the others
+        started = time.perf_counter()
+        try:
+            for chunk in compare_stream(
+                    self.first_path, self.second_path, self.first_owner, self.second_owner, DIFF_ENGINES[self.engine]
+            ):
+                render.add(chunk)
+        except Exception as error:
+            with diff_renders_lock:
+                del diff_renders[self.etag]
+            render.finish(error)
+            return
+        diff_render_seconds.observe(time.perf_counter() - started, engine=self.engine)
+        with diff_renders_lock:
+            diff_cache.put(self.etag, "".join(render.chunks))
+            del diff_renders[self.etag]
+        render.finish()
@@ -1,96 +1,270 @@
+import glob
+import inspect
 import os
-import re
+import sys
+import time
 from difflib import SequenceMatcher
-from typing import List
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
 
+import numpy as np
 from jellyfish import hamming_distance, match_rating_comparison, jaro_winkler_similarity
 from jellyfish import levenshtein_distance, damerau_levenshtein_distance, jaro_similarity
-from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
+from web.src.models.assignment import Assignment
+from web.src.models.corpus import Corpus
+from web.src.models.similarity_matrix import SimilarityMatrix
 from web.src.models.solution import Solution
+from web.src.utils.metrics_utils import registry
+from web.src.utils.normalize_utils import clean_solution_content
+from web.src.utils.parallel_utils import compare_pairs
+from web.src.utils.store_utils import ScoreStore, get_pair_key
+from web.src.utils.winnowing_utils import KGRAM_SIZE, WINDOW_SIZE, compute_winnowing_similarities
 
-regex_to_remove_comment = r'{-[^}]*-}|[\t\s]*--[^\n]*'
-regex_to_remove_unnecessary_spaces = r'[^\S\r\n\t]{2,}'
-regex_to_remove_unnecessary_tabs = r'\t+'
-regex_to_remove_words_in_quotes = r'"[^"]*"|\'.*\''
+comparison_seconds = registry.histogram("comparison_seconds", "Time spent scoring the pairs of one table")
+comparison_pairs = registry.counter("comparison_pairs_total", "Pairs scored by a comparison method")
+comparison_pairs_per_second = registry.gauge("comparison_pairs_per_second", "Pairs per second of the last table")
+score_store_lookups = registry.counter("score_store_lookups_total", "Pairs looked up in the score store")
 
 
 def get_file_content(path):
-    with open(path, encoding="utf-8") as file:
+    # a glob can match binary files, they are shown with replacement characters instead of failing the load
+    with open(path, encoding="utf-8", errors="replace") as file:
         return file.readlines()
 
 
-def to_fixed(numObj, digits=0):
-    return f"{numObj:.{digits}f}"
+def python_diff(from_text: str, to_text: str):
+    clean_texts = [clean_solution_content(from_text).split('\n'), clean_solution_content(to_text).split('\n')]
+    return SequenceMatcher(a=clean_texts[0], b=clean_texts[1]).ratio()
 
 
-def clean_solution_content(solution_content: str) -> str:
-    solution_content = re.sub(pattern=regex_to_remove_comment, repl='', string=solution_content)
-    solution_content = re.sub(pattern=regex_to_remove_unnecessary_tabs, repl=' ', string=solution_content)
-    solution_content = re.sub(pattern=regex_to_remove_unnecessary_spaces, repl=' ', string=solution_content)
-    solution_content = '\n'.join([line.strip() for line in solution_content.split('\n') if line.strip() != ''])
-    return solution_content
+def load_solution_content(solution: Solution, path_to_file: str) -> str:
+    path = os.path.join(solution.folder_with_solution, path_to_file)
+    return clean_solution_content(''.join(get_file_content(path)))
 
 
-def python_diff(from_text: str, to_text: str):
-    clean_texts = [clean_solution_content(from_text).split('\n'), clean_solution_content(to_text).split('\n')]
-    return SequenceMatcher(a=clean_texts[0], b=clean_texts[1]).ratio()
+def load_corpus(solutions: List[Solution], path_to_file: str) -> Corpus:
+    owners = []
+    contents = []
+    for solution in solutions:
+        owners.append(solution.owner)
+        contents.append(load_solution_content(solution, path_to_file))
+    return Corpus(owners, contents)
+
+
+def load_assignments(solutions: List[Solution], patterns: List[str]) -> Dict[str, Assignment]:
+    # every file is read once per fork, whatever number of tables is built from it later
+    assignments = {}
+    for path_to_file in find_assignment_paths(solutions, patterns):
+        assignment_solutions = [
+            solution for solution in solutions
+            if Path(os.path.join(solution.folder_with_solution, path_to_file)).is_file()
+        ]
+        corpus = load_corpus(assignment_solutions, path_to_file)
+        assignments[path_to_file] = Assignment(path_to_file, assignment_solutions, corpus)
+    return assignments
+
+
+def find_assignment_paths(solutions: List[Solution], patterns: List[str]) -> List[str]:
+    paths = set()
+    for solution in solutions:
+        for pattern in patterns:
+            for path in glob.glob(pattern.lstrip("/"), root_dir=solution.folder_with_solution, recursive=True):
+                if os.path.isfile(os.path.join(solution.folder_with_solution, path)):
+                    paths.add(path.replace(os.sep, "/"))
+    return sorted(paths)
+
+
+def create_table(corpus: Corpus, matrix: np.ndarray, higher_is_similar: bool = True) -> SimilarityMatrix:
+    return SimilarityMatrix(corpus.owners, matrix, higher_is_similar)
+
+
+def compute_comparison_matrix(corpus: Corpus,
+                              comparison_method,
+                              symmetric: bool = True,
+                              workers: int | None = None,
+                              pairs: List[Tuple[int, int]] | None = None,
+                              store: ScoreStore | None = None,
+                              progress=None) -> np.ndarray:
+    size = len(corpus)
+    matrix = np.full((size, size), np.nan)
+    if pairs is None:
+        pairs = [
+            (row_num, col_num)
+            for row_num in range(size)
+            for col_num in range(row_num + 1 if symmetric else 0, size)
+            if row_num != col_num
+        ]
+    elif not symmetric:
+        pairs = pairs + [(col_num, row_num) for row_num, col_num in pairs]
+    if progress:
+        progress.start(pairs, symmetric)
+
+    def fill(row_num: int, col_num: int, value):
+        matrix[row_num][col_num] = np.nan if value is None else value
+        if symmetric:
+            matrix[col_num][row_num] = matrix[row_num][col_num]
+        if progress:
+            progress.add(row_num, col_num, matrix[row_num][col_num])
+
+    metric = comparison_method.__name__
+    missing_pairs = pairs
+    if store is not None:
+        known_scores = store.load(metric, corpus.hashes)
+        missing_pairs = []
+        for row_num, col_num in pairs:
+            key = get_pair_key(corpus.hashes[row_num], corpus.hashes[col_num], symmetric)
+            if key in known_scores:
+                fill(row_num, col_num, known_scores[key])
+            else:
+                missing_pairs.append((row_num, col_num))
+        score_store_lookups.inc(len(pairs) - len(missing_pairs), method=metric, result="hit")
+        score_store_lookups.inc(len(missing_pairs), method=metric, result="miss")
+
+    new_scores = []
+    started = time.perf_counter()
+    for row_num, col_num, value in compare_pairs(corpus.contents, comparison_method, missing_pairs, workers):
+        fill(row_num, col_num, value)
+        if store is not None:
+            new_scores.append((*get_pair_key(corpus.hashes[row_num], corpus.hashes[col_num], symmetric), value))
+    elapsed = time.perf_counter() - started
+    comparison_seconds.observe(elapsed, method=metric)
+    comparison_pairs.inc(len(missing_pairs), method=metric)
+    if missing_pairs and elapsed > 0:
+        comparison_pairs_per_second.set(len(missing_pairs) / elapsed, method=metric)
+    if store is not None:
+        store.save(metric, new_scores)
+    return matrix
+
+
+def create_comparison_table(corpus: Corpus,
+                            comparison_method,
+                            symmetric: bool = True,
+                            workers: int | None = None,
+                            pairs: List[Tuple[int, int]] | None = None,
+                            store: ScoreStore | None = None,
+                            higher_is_similar: bool = True,
+                            progress=None):
+    matrix = compute_comparison_matrix(corpus, comparison_method, symmetric, workers, pairs, store, progress)
+    return create_table(corpus, matrix, higher_is_similar)
+
+
+def sequence_matcher_ratio(from_text: str, to_text: str):
+    return SequenceMatcher(a=from_text.split('\n'), b=to_text.split('\n')).ratio()
+
+
+def create_similarity_table(corpus: Corpus,
+                            pairs: List[Tuple[int, int]] | None = None,
+                            store: ScoreStore | None = None,
+                            progress=None):
+    # SequenceMatcher.ratio is not symmetric because of the autojunk heuristic
+    return create_comparison_table(
+        corpus, sequence_matcher_ratio, symmetric=False, pairs=pairs, store=store, progress=progress
+    )
+
 
+def create_table_from_similarities(corpus: Corpus,
+                                   matrix: np.ndarray,
+                                   pairs: List[Tuple[int, int]] | None = None,
+                                   progress=None):
+    size = len(corpus)
+    if pairs is not None:
+        similarities = matrix
+        matrix = np.full((size, size), np.nan)
+        for row_num, col_num in pairs:
+            matrix[row_num][col_num] = matrix[col_num][row_num] = similarities[row_num][col_num]
+    if progress:
+        if pairs is None:
+            pairs = [(row_num, col_num) for row_num in range(size) for col_num in range(row_num + 1, size)]
+        progress.start(pairs, True)
+        for row_num, col_num in pairs:
+            progress.add(row_num, col_num, matrix[row_num][col_num])
+    return create_table(corpus, matrix)
 
-def create_comparison_table(solutions: List[Solution], path_to_file: str, comparison_method):
-    table = [[""] + list(map(lambda solution: solution.owner, solutions))]
-    for row_num, first_solution in enumerate(solutions):
-        row = [first_solution.owner]
-        first_path = os.path.join(first_solution.folder_with_solution, path_to_file)
-        first_solution_content = clean_solution_content(''.join(get_file_content(first_path)))
-        for col_num, second_solution in enumerate(solutions):
-            if row_num == col_num:
-                row.append("")
-                continue
-            second_path = os.path.join(second_solution.folder_with_solution, path_to_file)
-            second_solution_content = clean_solution_content(''.join(get_file_content(second_path)))
-            row.append(to_fixed(comparison_method(first_solution_content, second_solution_content), digits=2))
-        table.append(row)
-    return table
 
+def create_cosine_similarity_table(corpus: Corpus,
+                                   use_tfidf: bool = False,
+                                   ngram_range: Tuple[int, int] = (1, 1),
+                                   pairs: List[Tuple[int, int]] | None = None,
+                                   store: ScoreStore | None = None,
+                                   progress=None):
+    # a single sparse product is cheaper than looking the scores up, so the store is not used
+    if len(corpus) == 0:
+        return create_table(corpus, np.empty((0, 0)))
+    vectorizer = TfidfVectorizer(ngram_range=ngram_range) if use_tfidf else CountVectorizer(ngram_range=ngram_range)
+    vectors = vectorizer.fit_transform(corpus.contents)
+    return create_table_from_similarities(corpus, cosine_similarity(vectors), pairs, progress)
 
-def create_similarity_table(solutions: List[Solution], path_to_file: str):
-    def comparison_method(from_text: str, to_text: str):
-        return SequenceMatcher(a=from_text.split('\n'), b=to_text.split('\n')).ratio()
 
-    return create_comparison_table(solutions, path_to_file, comparison_method)
+def create_winnowing_table(corpus: Corpus,
+                           kgram_size: int = KGRAM_SIZE,
+                           window_size: int = WINDOW_SIZE,
+                           pairs: List[Tuple[int, int]] | None = None,
+                           store: ScoreStore | None = None,
+                           progress=None):
+    # all-pairs overlap comes from the fingerprint index at once, so the store is not used
+    if len(corpus) == 0:
+        return create_table(corpus, np.empty((0, 0)))
+    similarities = compute_winnowing_similarities(corpus.contents, kgram_size, window_size)
+    return create_table_from_similarities(corpus, similarities, pairs, progress)
 
 
-def create_cosine_similarity_table(solutions: List[Solution], path_to_file: str):
-    def cosine_sim(from_text: str, to_text: str):
-        clean_texts = [clean_solution_content(from_text), clean_solution_content(to_text)]
-        vectorizer = CountVectorizer().fit_transform(clean_texts)
-        vectors = vectorizer.toarray()
-        return cosine_similarity(vectors)[0][1]
+def create_levenshtein_dist_table(corpus: Corpus,
+                                  pairs: List[Tuple[int, int]] | None = None,
+                                  store: ScoreStore | None = None,
+                                  progress=None):
+    return create_comparison_table(
+        corpus, levenshtein_distance, pairs=pairs, store=store, higher_is_similar=False, progress=progress
+    )
 
-    return create_comparison_table(solutions, path_to_file, cosine_sim)
 
+def create_damerau_levenshtein_dist_table(corpus: Corpus,
+                                          pairs: List[Tuple[int, int]] | None = None,
+                                          store: ScoreStore | None = None,
+                                          progress=None):
+    return create_comparison_table(
+        corpus, damerau_levenshtein_distance, pairs=pairs, store=store, higher_is_similar=False, progress=progress
+    )
 
-def create_levenshtein_dist_table(solutions: List[Solution], path_to_file: str):
-    return create_comparison_table(solutions, path_to_file, levenshtein_distance)
 
+def create_jaro_sim_table(corpus: Corpus,
+                          pairs: List[Tuple[int, int]] | None = None,
+                          store: ScoreStore | None = None,
+                          progress=None):
+    return create_comparison_table(corpus, jaro_similarity, pairs=pairs, store=store, progress=progress)
 
-def create_damerau_levenshtein_dist_table(solutions: List[Solution], path_to_file: str):
-    return create_comparison_table(solutions, path_to_file, damerau_levenshtein_distance)
 
+def create_jaro_winkler_sim_table(corpus: Corpus,
+                                  pairs: List[Tuple[int, int]] | None = None,
+                                  store: ScoreStore | None = None,
+                                  progress=None):
+    return create_comparison_table(corpus, jaro_winkler_similarity, pairs=pairs, store=store, progress=progress)
 
-def create_jaro_sim_table(solutions: List[Solution], path_to_file: str):
-    return create_comparison_table(solutions, path_to_file, jaro_similarity)
 
+def create_match_rating_cmp_table(corpus: Corpus,
+                                  pairs: List[Tuple[int, int]] | None = None,
+                                  store: ScoreStore | None = None,
+                                  progress=None):
+    return create_comparison_table(corpus, match_rating_comparison, pairs=pairs, store=store, progress=progress)
 
-def create_jaro_winkler_sim_table(solutions: List[Solution], path_to_file: str):
-    return create_comparison_table(solutions, path_to_file, jaro_winkler_similarity)
 
+def create_hamming_dist_table(corpus: Corpus,
+                              pairs: List[Tuple[int, int]] | None = None,
+                              store: ScoreStore | None = None,
+                              progress=None):
+    return create_comparison_table(
+        corpus, hamming_distance, pairs=pairs, store=store, higher_is_similar=False, progress=progress
+    )
 
-def create_match_rating_cmp_table(solutions: List[Solution], path_to_file: str):
-    return create_comparison_table(solutions, path_to_file, match_rating_comparison)
 
+NOT_BUILDERS = {"create_table", "create_comparison_table", "create_table_from_similarities"}
 
-def create_hamming_dist_table(solutions: List[Solution], path_to_file: str):
-    return create_comparison_table(solutions, path_to_file, hamming_distance)
+# every create_*_table function, named without the prefix and the suffix;
+# the web app, batch.py and the benchmarks all look metrics up here
+TABLE_BUILDERS: Dict[str, Callable] = {
+    name.removeprefix("create_").removesuffix("_table"): function
+    for name, function in inspect.getmembers(sys.modules[__name__], inspect.isfunction)
+    if name.startswith("create_") and name.endswith("_table") and name not in NOT_BUILDERS
+}
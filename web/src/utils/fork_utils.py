@@ -1,11 +1,27 @@
-import concurrent.futures
+import asyncio
 import os
+import shutil
 import subprocess
-from typing import Tuple, List
+import time
+from typing import AsyncIterator, Tuple, List
 
 import requests
 
 from web.src.models.solution import Solution
+from web.src.utils.github_utils import github_client
+from web.src.utils.metrics_utils import registry
+
+CLONE_CONCURRENCY = int(os.environ.get("CLONE_CONCURRENCY", 10))
+CLONE_TIMEOUT = float(os.environ.get("CLONE_TIMEOUT", 120))
+CLONE_RETRIES = int(os.environ.get("CLONE_RETRIES", 2))
+CLONE_RETRY_DELAY = 1
+
+fork_listing_seconds = registry.histogram("fork_listing_seconds", "Time spent listing the forks of a repository")
+fork_download_seconds = registry.histogram("fork_download_seconds", "Time spent downloading every fork of a repository")
+clone_seconds = registry.histogram("clone_seconds", "Time spent cloning or updating one fork")
+clone_attempts = registry.counter("clone_attempts_total", "Clone attempts by result")
+clones_waiting = registry.gauge("clones_waiting", "Clones queued behind the concurrency limit")
+clones_running = registry.gauge("clones_running", "Clones in progress")
 
 
 class ParseException(Exception):
@@ -23,75 +39,157 @@ def parse_url(url: str, prefix: str | None):
 
 
 def check_user_found(username: str) -> bool:
-    url = f"https://api.github.com/users/{username}"
-    response = requests.get(url=url)
-    return response.status_code == 200
+    return github_client.user_exists(username)
 
 
 def check_repository_found(username: str, repository_name: str) -> bool:
-    url = f"https://api.github.com/repos/{username}/{repository_name}"
-    response = requests.get(url=url)
-    return response.status_code == 200
+    return github_client.repository_exists(username, repository_name)
 
 
-def get_forks_information(username: str, repository_name: str) -> requests.Response:
-    url = f"https://api.github.com/repos/{username}/{repository_name}/forks"
-    response = requests.get(url=url)
-    if response.status_code != 200:
-        raise requests.exceptions.RequestException("Error getting information about forks")
-    return response
+def get_forks_information(username: str, repository_name: str) -> List[dict]:
+    return github_client.get_forks(username, repository_name)
 
 
-def download_repository(owner: str, fork_url: str, branch: str, folder: str) -> Tuple[int, str, str]:
-    path = os.path.join(folder, owner)
-
-    env = os.environ.copy()
-    proc = subprocess.run(
-        f"git clone {fork_url} {path} -b {branch}", shell=True, text=True,
-        env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+async def run_git(*args: str, cwd: str | None = None) -> subprocess.CompletedProcess:
+    proc = await asyncio.create_subprocess_exec(
+        "git", *args, cwd=cwd, env=os.environ.copy(),
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
     )
-
-    return proc.returncode, owner, path
-
-
-def download_solutions(username: str,
-                       repository_name: str,
-                       branch: str = "master",
-                       folder: str = "tmp") -> List[Solution]:
     try:
-        response = get_forks_information(username, repository_name)
+        stdout, _ = await proc.communicate()
+    except asyncio.CancelledError:
+        # a clone that timed out must not leave git running
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+        raise
+    return subprocess.CompletedProcess(["git", *args], proc.returncode, stdout.decode(errors="replace"))
+
+
+async def is_clone_of(path: str, fork_url: str) -> bool:
+    if not os.path.isdir(os.path.join(path, ".git")):
+        return False
+    proc = await run_git("config", "--get", "remote.origin.url", cwd=path)
+    return proc.returncode == 0 and proc.stdout.strip() == fork_url
+
+
+async def set_sparse_checkout(path: str, paths_to_files: List[str] | None) -> int:
+    if not paths_to_files:
+        return 0
+    patterns = ["/" + path_to_file.lstrip("/") for path_to_file in paths_to_files]
+    return (await run_git("sparse-checkout", "set", "--no-cone", *patterns, cwd=path)).returncode
+
+
+async def update_repository(path: str, branch: str, paths_to_files: List[str] | None) -> int:
+    # whether a file changed is not tracked here: unchanged contents keep their scores in the score store
+    for args in (("fetch", "--depth", "1", "origin", branch), ("reset", "--hard", "FETCH_HEAD")):
+        proc = await run_git(*args, cwd=path)
+        if proc.returncode != 0:
+            return proc.returncode
+    return await set_sparse_checkout(path, paths_to_files)
+
+
+async def clone_repository(fork_url: str, path: str, branch: str, paths_to_files: List[str] | None) -> int:
+    await asyncio.to_thread(shutil.rmtree, path, ignore_errors=True)
+    proc = await run_git("clone", "--depth", "1", "--filter=blob:none", "--no-checkout", "-b", branch, fork_url, path)
+    if proc.returncode != 0:
+        return proc.returncode
+    returncode = await set_sparse_checkout(path, paths_to_files)
+    if returncode != 0:
+        return returncode
+    return (await run_git("checkout", branch, cwd=path)).returncode
+
+
+async def fetch_repository(fork_url: str,
+                           path: str,
+                           branch: str,
+                           paths_to_files: List[str] | None) -> int:
+    if await is_clone_of(path, fork_url):
+        returncode = await update_repository(path, branch, paths_to_files)
+        if returncode == 0:
+            return returncode
+    return await clone_repository(fork_url, path, branch, paths_to_files)
+
+
+async def download_repository(owner: str,
+                              fork_url: str,
+                              branch: str,
+                              folder: str,
+                              paths_to_files: List[str] | None = None) -> Tuple[int, str, str]:
+    path = os.path.join(folder, owner)
+    returncode = -1
+    for attempt in range(CLONE_RETRIES + 1):
+        if attempt > 0:
+            await asyncio.sleep(CLONE_RETRY_DELAY * attempt)
+        started = time.perf_counter()
+        try:
+            returncode = await asyncio.wait_for(fetch_repository(fork_url, path, branch, paths_to_files), CLONE_TIMEOUT)
+            result = "ok" if returncode == 0 else "failed"
+        except asyncio.TimeoutError:
+            returncode = -1
+            result = "timeout"
+        clone_seconds.observe(time.perf_counter() - started)
+        clone_attempts.inc(result=result)
+        if returncode == 0:
+            break
+    return returncode, owner, path
+
+
+async def get_fork_urls(username: str, repository_name: str) -> List[Tuple[str, str]]:
+    # the GitHub client is blocking, so its calls run in a thread and the event loop stays free
+    try:
+        with fork_listing_seconds.time():
+            json_response = await asyncio.to_thread(get_forks_information, username, repository_name)
+    except requests.exceptions.JSONDecodeError:
+        raise requests.exceptions.RequestException("JSON decoding error")
     except requests.exceptions.RequestException as exception:
-        if not check_user_found(username):
+        if not await asyncio.to_thread(check_user_found, username):
             raise requests.exceptions.RequestException("User with such username does not found")
 
-        if not check_repository_found(username, repository_name):
+        if not await asyncio.to_thread(check_repository_found, username, repository_name):
             raise requests.exceptions.RequestException("Repository with such name does not found")
 
         raise exception
 
+    forks = []
+    for fork in json_response:
+        try:
+            forks.append((fork['owner']['login'], fork["clone_url"]))
+        except KeyError:
+            pass  # TODO подумать как обрабатывать такой случай
+    return forks
+
+
+async def iter_downloaded_solutions(forks: List[Tuple[str, str]],
+                                    branch: str = "master",
+                                    folder: str = "tmp",
+                                    paths_to_files: List[str] | None = None) -> AsyncIterator[Solution]:
+    # solutions are yielded in the order their clones finish, so callers can work on them while the rest download
+    semaphore = asyncio.Semaphore(CLONE_CONCURRENCY)
+
+    async def download(owner: str, fork_url: str):
+        clones_waiting.inc()
+        try:
+            await semaphore.acquire()
+        finally:
+            clones_waiting.dec()
+        clones_running.inc()
+        try:
+            return await download_repository(owner, fork_url, branch, folder, paths_to_files)
+        finally:
+            clones_running.dec()
+            semaphore.release()
+
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(download(owner, fork_url)) for owner, fork_url in forks]
     try:
-        json_response = response.json()
-        if not isinstance(json_response, list):
-            raise requests.exceptions.RequestException(f"Expected type 'List', got {type(json_response)}")
-
-        forks = []
-        for fork in json_response:
-            try:
-                forks.append([fork['owner']['login'], fork["clone_url"]])
-            except KeyError:
-                pass  # TODO подумать как обрабатывать такой случай
-
-        with concurrent.futures.ProcessPoolExecutor(max_workers=10) as executor:
-            futures = [
-                executor.submit(download_repository, owner, fork_url, branch, folder)
-                for owner, fork_url in forks
-            ]
-
-            solutions = []
-            for future in concurrent.futures.as_completed(futures):
-                returncode, owner, path_to_fork = future.result()
-                if returncode == 0:
-                    solutions.append(Solution(owner, path_to_fork))
-            return solutions
-    except requests.exceptions.JSONDecodeError:
-        raise requests.exceptions.RequestException("JSON decoding error")
+        for future in asyncio.as_completed(tasks):
+            returncode, owner, path_to_fork = await future
+            if returncode == 0:
+                yield Solution(owner, path_to_fork)
+        fork_download_seconds.observe(time.perf_counter() - started)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,114 @@
+import concurrent.futures
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse, parse_qs
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import parse_header_links
+
+DEFAULT_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+PER_PAGE = 100
+MAX_RATE_LIMIT_WAIT = 60
+
+
+class GitHubResponse:
+
+    def __init__(self, status_code: int, headers: Dict[str, str], data):
+        self.status_code = status_code
+        self.headers = headers
+        self.data = data
+
+    def last_page(self) -> int:
+        for link in parse_header_links(self.headers.get("Link", "")):
+            if link.get("rel") == "last":
+                return int(parse_qs(urlparse(link["url"]).query).get("page", ["1"])[0])
+        return 1
+
+
+class GitHubClient:
+
+    def __init__(self,
+                 base_url: str = DEFAULT_API_URL,
+                 token: str | None = os.environ.get("GITHUB_TOKEN"),
+                 max_workers: int = 8,
+                 timeout: float = 30):
+        self.base_url = base_url.rstrip("/")
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept"] = "application/vnd.github+json"
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        self.cache: Dict[Tuple[str, Tuple], Tuple[str, GitHubResponse]] = {}
+        self.lock = threading.Lock()
+
+    def get(self, path: str, params: Dict[str, int | str] | None = None) -> GitHubResponse:
+        url = self.base_url + path
+        key = (url, tuple(sorted((params or {}).items())))
+        with self.lock:
+            cached = self.cache.get(key)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+
+        while True:
+            response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            if not self.wait_for_rate_limit(response):
+                break
+
+        if response.status_code == 304 and cached:
+            return cached[1]
+        data = response.json() if response.status_code == 200 else None
+        result = GitHubResponse(response.status_code, dict(response.headers), data)
+        if response.status_code == 200 and "ETag" in response.headers:
+            with self.lock:
+                self.cache[key] = (response.headers["ETag"], result)
+        return result
+
+    @staticmethod
+    def wait_for_rate_limit(response: requests.Response) -> bool:
+        if response.status_code not in (403, 429):
+            return False
+        if "Retry-After" in response.headers:
+            delay = float(response.headers["Retry-After"])
+        elif response.headers.get("X-RateLimit-Remaining") == "0":
+            delay = float(response.headers.get("X-RateLimit-Reset", time.time())) - time.time()
+        else:
+            return False
+        if delay > MAX_RATE_LIMIT_WAIT:
+            raise requests.exceptions.RequestException("GitHub API rate limit exceeded")
+        time.sleep(max(delay, 0))
+        return True
+
+    def user_exists(self, username: str) -> bool:
+        return self.get(f"/users/{username}").status_code == 200
+
+    def repository_exists(self, username: str, repository_name: str) -> bool:
+        return self.get(f"/repos/{username}/{repository_name}").status_code == 200
+
+    def get_forks(self, username: str, repository_name: str) -> List[dict]:
+        path = f"/repos/{username}/{repository_name}/forks"
+        first_page = self.get(path, {"per_page": PER_PAGE, "page": 1})
+        pages = [first_page]
+        if first_page.status_code == 200 and first_page.last_page() > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                pages += executor.map(
+                    lambda page: self.get(path, {"per_page": PER_PAGE, "page": page}),
+                    range(2, first_page.last_page() + 1)
+                )
+
+        forks = []
+        for page in pages:
+            if page.status_code != 200:
+                raise requests.exceptions.RequestException("Error getting information about forks")
+            if not isinstance(page.data, list):
+                raise requests.exceptions.RequestException(f"Expected type 'List', got {type(page.data)}")
+            forks.extend(page.data)
+        return forks
+
+
+github_client = GitHubClient()
@@ -0,0 +1,215 @@
+import concurrent.futures
+import uuid
+from typing import Dict, List, Hashable, Tuple
+
+import numpy as np
+
+from web.src.models.assignment import Course
+from web.src.models.corpus import Corpus
+from web.src.models.similarity_matrix import SimilarityMatrix, format_block, format_row
+from web.src.utils.async_utils import executor
+from web.src.utils.metrics_utils import registry, run_profiled
+from web.src.utils.parallel_utils import compare_pairs
+from web.src.utils.store_utils import ScoreStore, get_pair_key
+
+table_build_seconds = registry.histogram("table_build_seconds", "Time spent building a table in a job")
+jobs_running = registry.gauge("jobs_running", "Table jobs that are queued or running")
+score_store_lookups = registry.counter("score_store_lookups_total", "Pairs looked up in the score store")
+
+
+class Job:
+
+    def __init__(self, metric: str, owners: List[str]):
+        self.job_id = uuid.uuid4().hex
+        self.metric = metric
+        self.owners = owners
+        size = len(owners)
+        self.matrix = np.full((size, size), np.nan)
+        self.symmetric = True
+        self.total = 0
+        self.done = 0
+        self.remaining = [0] * size
+        self.ready_rows: List[int] = []
+        self.table: SimilarityMatrix | None = None
+        self.error = None
+        self.profile: str | None = None
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return "failed"
+        if self.table is not None:
+            return "done"
+        return "running"
+
+    def set_table(self, table: SimilarityMatrix):
+        # the table holds its own float32 copy, so the scores filled in while running are no longer needed
+        self.table = table
+        self.matrix = np.empty((0, 0))
+
+    def start(self, pairs: List[Tuple[int, int]], symmetric: bool):
+        self.total = len(pairs)
+        self.symmetric = symmetric
+        for row_num, col_num in pairs:
+            self.remaining[row_num] += 1
+            if symmetric:
+                self.remaining[col_num] += 1
+        self.ready_rows.extend(row_num for row_num, remaining in enumerate(self.remaining) if remaining == 0)
+
+    def add(self, row_num: int, col_num: int, value: float):
+        self.matrix[row_num][col_num] = value
+        if self.symmetric:
+            self.matrix[col_num][row_num] = value
+        self.done += 1
+        self._fill(row_num)
+        if self.symmetric:
+            self._fill(col_num)
+
+    def _fill(self, row_num: int):
+        self.remaining[row_num] -= 1
+        if self.remaining[row_num] == 0:
+            self.ready_rows.append(row_num)
+
+    def row(self, row_num: int) -> List[str]:
+        if self.table is not None:
+            return self.table.format_row(row_num)
+        return format_row(self.owners[row_num], row_num, self.matrix[row_num])
+
+    def block(self, row_start: int, rows: int, col_start: int, cols: int) -> dict:
+        if self.table is not None:
+            return self.table.format_block(row_start, rows, col_start, cols)
+        return format_block(self.owners, self.matrix, row_start, rows, col_start, cols)
+
+    def progress(self) -> dict:
+        return {
+            "done": self.done, "total": self.total, "rows": len(self.ready_rows), "status": self.status,
+            "profile": self.profile
+        }
+
+
+class StreamingJob(Job):
+    # the corpus grows while forks are downloaded, and every new document
+    # is scored against the ones already loaded as soon as it arrives
+
+    def __init__(self, metric: str, corpus: Corpus, comparison_method, symmetric: bool = True,
+                 higher_is_similar: bool = True, store: ScoreStore | None = None):
+        super().__init__(metric, corpus.owners)
+        self.corpus = corpus
+        self.comparison_method = comparison_method
+        self.symmetric = symmetric
+        self.higher_is_similar = higher_is_similar
+        self.store = store
+
+    def grow(self, size: int):
+        if size <= len(self.matrix):
+            return
+        capacity = max(size, 2 * len(self.matrix), 16)
+        matrix = np.full((capacity, capacity), np.nan)
+        matrix[:len(self.matrix), :len(self.matrix)] = self.matrix
+        self.matrix = matrix
+
+    def add_document(self, owner: str, content: str):
+        row_num = len(self.corpus)
+        self.grow(row_num + 1)
+        pairs = [(row_num, col_num) for col_num in range(row_num)]
+        if not self.symmetric:
+            pairs += [(col_num, row_num) for col_num in range(row_num)]
+        self.total += len(pairs)
+        self.corpus.add(owner, content)
+        hashes = self.corpus.hashes
+        # the scores are stored under the same name as the ones of compute_comparison_matrix
+        metric = self.comparison_method.__name__
+        missing_pairs = pairs
+        if self.store is not None:
+            known_scores = self.store.load(metric, hashes, including=hashes[row_num])
+            missing_pairs = []
+            for first, second in pairs:
+                key = get_pair_key(hashes[first], hashes[second], self.symmetric)
+                if key in known_scores:
+                    self._set(first, second, known_scores[key])
+                else:
+                    missing_pairs.append((first, second))
+            score_store_lookups.inc(len(pairs) - len(missing_pairs), method=metric, result="hit")
+            score_store_lookups.inc(len(missing_pairs), method=metric, result="miss")
+
+        new_scores = []
+        # one row is too little work to pay for starting a process pool
+        for first, second, value in compare_pairs(self.corpus.contents, self.comparison_method, missing_pairs, 1):
+            self._set(first, second, value)
+            if self.store is not None:
+                new_scores.append((*get_pair_key(hashes[first], hashes[second], self.symmetric), value))
+        if self.store is not None:
+            self.store.save(metric, new_scores)
+        self.ready_rows.append(row_num)
+
+    def _set(self, first: int, second: int, value: float | None):
+        self.matrix[first][second] = np.nan if value is None else value
+        if self.symmetric:
+            self.matrix[second][first] = self.matrix[first][second]
+        self.done += 1
+
+    def row(self, row_num: int) -> List[str]:
+        if self.table is not None:
+            return self.table.format_row(row_num)
+        return format_row(self.owners[row_num], row_num, self.matrix[row_num, :len(self.owners)])
+
+    def finish(self) -> SimilarityMatrix:
+        size = len(self.corpus)
+        self.set_table(SimilarityMatrix(list(self.corpus.owners), self.matrix[:size, :size], self.higher_is_similar))
+        return self.table
+
+
+class JobManager:
+
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self.active: Dict[Hashable, Job] = {}
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def submit(self, metric: str, builder, corpus: Corpus | Course, on_done=None, profile: bool = False) -> Job:
+        key = (metric, id(corpus))
+        if key in self.active:
+            return self.active[key]
+
+        job = Job(metric, corpus.owners)
+        self.jobs[job.job_id] = job
+        self.active[key] = job
+
+        def build(corpus: Corpus | Course, progress: Job):
+            with table_build_seconds.time(metric=metric):
+                if not profile:
+                    return builder(corpus, progress=progress)
+                # the dump is named after the job, so it can be found from the job's progress
+                progress.profile = f"{metric.replace(':', '-')}-{progress.job_id}.prof"
+                return run_profiled(progress.profile, builder, corpus, progress=progress)
+
+        def finish(future: concurrent.futures.Future):
+            jobs_running.dec()
+            self.active.pop(key, None)
+            if future.cancelled():
+                job.error = "cancelled"
+                return
+            if future.exception() is not None:
+                job.error = str(future.exception())
+                return
+            job.set_table(future.result())
+            if on_done:
+                on_done(job)
+
+        jobs_running.inc()
+        future = executor.submit(build, corpus, progress=job)
+        future.add_done_callback(finish)
+        return job
+
+    def add(self, metric: str, corpus: Corpus, job: Job):
+        self.jobs[job.job_id] = job
+        self.active[(metric, id(corpus))] = job
+
+    def finish(self, metric: str, corpus: Corpus):
+        self.active.pop((metric, id(corpus)), None)
+
+    def clear(self):
+        self.jobs = {}
+        self.active = {}
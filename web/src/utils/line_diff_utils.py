@@ -0,0 +1,217 @@
+import difflib
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+MAX_CHAIN = 64
+MAX_MYERS_COST = 2048
+# difflib pairs up the lines of a changed region in quadratic time, so large regions are fed to it in slices
+MDIFF_SLICE = 8
+
+
+class LineInterner:
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+
+    def intern(self, lines: Sequence[str]) -> Tuple[int, ...]:
+        return tuple(self.ids.setdefault(line, len(self.ids)) for line in lines)
+
+
+def _myers_matches(a: Sequence[Hashable], b: Sequence[Hashable],
+                   a_lo: int, a_hi: int, b_lo: int, b_hi: int,
+                   matches: List[Tuple[int, int]]):
+    n, m = a_hi - a_lo, b_hi - b_lo
+    if set(a[a_lo:a_hi]).isdisjoint(b[b_lo:b_hi]):
+        return
+    frontier = {1: 0}
+    trace = []
+    for cost in range(min(n + m, MAX_MYERS_COST) + 1):
+        trace.append(dict(frontier))
+        for k in range(-cost, cost + 1, 2):
+            if k == -cost or (k != cost and frontier[k - 1] < frontier[k + 1]):
+                x = frontier[k + 1]
+            else:
+                x = frontier[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x, y = x + 1, y + 1
+            frontier[k] = x
+            if x >= n and y >= m:
+                _myers_backtrack(trace, n, m, a_lo, b_lo, matches)
+                return
+    # the regions differ too much to be worth aligning, so they are reported as a plain replacement
+
+
+def _myers_backtrack(trace: List[Dict[int, int]], x: int, y: int, a_lo: int, b_lo: int,
+                     matches: List[Tuple[int, int]]):
+    for cost in range(len(trace) - 1, -1, -1):
+        frontier = trace[cost]
+        k = x - y
+        if k == -cost or (k != cost and frontier[k - 1] < frontier[k + 1]):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        previous_x = frontier[previous_k]
+        previous_y = previous_x - previous_k
+        while x > previous_x and y > previous_y:
+            x, y = x - 1, y - 1
+            matches.append((a_lo + x, b_lo + y))
+        x, y = previous_x, previous_y
+
+
+def _find_unique_anchors(a: Sequence[Hashable], b: Sequence[Hashable],
+                         a_lo: int, a_hi: int, b_lo: int, b_hi: int) -> List[Tuple[int, int]]:
+    a_counts, a_positions = defaultdict(int), {}
+    for i in range(a_lo, a_hi):
+        a_counts[a[i]] += 1
+        a_positions[a[i]] = i
+    b_counts = defaultdict(int)
+    for j in range(b_lo, b_hi):
+        b_counts[b[j]] += 1
+    candidates = [
+        (a_positions[b[j]], j) for j in range(b_lo, b_hi) if b_counts[b[j]] == 1 and a_counts.get(b[j]) == 1
+    ]
+
+    # longest increasing subsequence of the a positions, taken in b order (patience sorting)
+    tails, tail_indexes, previous = [], [], [None] * len(candidates)
+    for index, (i, _) in enumerate(candidates):
+        position = bisect_left(tails, i)
+        if position > 0:
+            previous[index] = tail_indexes[position - 1]
+        if position == len(tails):
+            tails.append(i)
+            tail_indexes.append(index)
+        else:
+            tails[position] = i
+            tail_indexes[position] = index
+    anchors = []
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        anchors.append(candidates[index])
+        index = previous[index]
+    anchors.reverse()
+    return anchors
+
+
+def _find_anchor(a: Sequence[Hashable], b: Sequence[Hashable],
+                 a_lo: int, a_hi: int, b_lo: int, b_hi: int) -> Tuple[int, int, int] | None:
+    positions = defaultdict(list)
+    for i in range(a_lo, a_hi):
+        positions[a[i]].append(i)
+
+    best = None
+    best_rank = None
+    j = b_lo
+    while j < b_hi:
+        occurrences = positions.get(b[j])
+        if not occurrences or len(occurrences) > MAX_CHAIN:
+            j += 1
+            continue
+        next_j = j + 1
+        for i in occurrences:
+            start_i, start_j = i, j
+            while start_i > a_lo and start_j > b_lo and a[start_i - 1] == b[start_j - 1]:
+                start_i, start_j = start_i - 1, start_j - 1
+            end_i, end_j = i + 1, j + 1
+            while end_i < a_hi and end_j < b_hi and a[end_i] == b[end_j]:
+                end_i, end_j = end_i + 1, end_j + 1
+            # the rarest line wins, longer runs break ties
+            rank = (len(occurrences), start_i - end_i)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = (start_i, start_j, end_i - start_i), rank
+            next_j = max(next_j, end_j)
+        j = next_j
+    return best
+
+
+def get_matching_pairs(a: Sequence[Hashable], b: Sequence[Hashable]) -> List[Tuple[int, int]]:
+    """
+    Patience/histogram diff: align lines that are unique on both sides, otherwise split around
+    the rarest common line, and fall back to Myers where nothing is rare.
+    """
+    matches = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        a_lo, a_hi, b_lo, b_hi = regions.pop()
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            matches.append((a_lo, b_lo))
+            a_lo, b_lo = a_lo + 1, b_lo + 1
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi, b_hi = a_hi - 1, b_hi - 1
+            matches.append((a_hi, b_hi))
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        anchors = _find_unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+        if anchors:
+            matches.extend(anchors)
+            previous_i, previous_j = a_lo, b_lo
+            for i, j in anchors:
+                regions.append((previous_i, i, previous_j, j))
+                previous_i, previous_j = i + 1, j + 1
+            regions.append((previous_i, a_hi, previous_j, b_hi))
+            continue
+        anchor = _find_anchor(a, b, a_lo, a_hi, b_lo, b_hi)
+        if anchor is None:
+            _myers_matches(a, b, a_lo, a_hi, b_lo, b_hi, matches)
+            continue
+        start_i, start_j, length = anchor
+        matches.extend((start_i + offset, start_j + offset) for offset in range(length))
+        regions.append((a_lo, start_i, b_lo, start_j))
+        regions.append((start_i + length, a_hi, start_j + length, b_hi))
+    matches.sort()
+    return matches
+
+
+def get_matching_blocks(a: Sequence[Hashable], b: Sequence[Hashable]) -> List[Tuple[int, int, int]]:
+    blocks = []
+    for i, j in get_matching_pairs(a, b):
+        if blocks and blocks[-1][0] + blocks[-1][2] == i and blocks[-1][1] + blocks[-1][2] == j:
+            blocks[-1] = (blocks[-1][0], blocks[-1][1], blocks[-1][2] + 1)
+        else:
+            blocks.append((i, j, 1))
+    blocks.append((len(a), len(b), 0))
+    return blocks
+
+
+def get_opcodes(a: Sequence[Hashable], b: Sequence[Hashable]) -> List[Tuple[str, int, int, int, int]]:
+    opcodes = []
+    i = j = 0
+    for block_i, block_j, size in get_matching_blocks(a, b):
+        if i < block_i and j < block_j:
+            opcodes.append(("replace", i, block_i, j, block_j))
+        elif i < block_i:
+            opcodes.append(("delete", i, block_i, j, block_j))
+        elif j < block_j:
+            opcodes.append(("insert", i, block_i, j, block_j))
+        if size:
+            opcodes.append(("equal", block_i, block_i + size, block_j, block_j + size))
+        i, j = block_i + size, block_j + size
+    return opcodes
+
+
+def _shift_line(line: Tuple, offset: int) -> Tuple:
+    number, text = line
+    return (number + offset if number != '' else number), text
+
+
+def histogram_mdiff(from_lines: List[str], to_lines: List[str], **kwargs):
+    """
+    Drop-in replacement for difflib._mdiff: the lines are aligned by get_opcodes, and only
+    the regions between equal runs go through difflib, which adds the intraline markup.
+    Regions longer than MDIFF_SLICE lines are cut into slices that difflib pairs up separately.
+    """
+    interner = LineInterner()
+    a, b = interner.intern(from_lines), interner.intern(to_lines)
+    for tag, i1, i2, j1, j2 in get_opcodes(a, b):
+        if tag == "equal":
+            for i, j in zip(range(i1, i2), range(j1, j2)):
+                yield (i + 1, from_lines[i]), (j + 1, to_lines[j]), False
+            continue
+        slices = max(-(-(i2 - i1) // MDIFF_SLICE), -(-(j2 - j1) // MDIFF_SLICE))
+        for num in range(slices):
+            from_start, to_start = i1 + (i2 - i1) * num // slices, j1 + (j2 - j1) * num // slices
+            from_end, to_end = i1 + (i2 - i1) * (num + 1) // slices, j1 + (j2 - j1) * (num + 1) // slices
+            rows = difflib._mdiff(from_lines[from_start:from_end], to_lines[to_start:to_end], **kwargs)
+            for left, right, changed in rows:
+                yield _shift_line(left, from_start), _shift_line(right, to_start), changed
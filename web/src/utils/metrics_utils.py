@@ -0,0 +1,171 @@
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+METRICS_PREFIX = "task_similarity_"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300)
+# profiling is opt-in: without a folder to dump to, profile requests are refused
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def get_label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_labels(label_key: LabelKey, extra: Dict[str, str] | None = None) -> str:
+    labels = list(label_key) + list((extra or {}).items())
+    if not labels:
+        return ""
+    escaped = [
+        (name, value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for name, value in labels
+    ]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values: Dict[LabelKey, float] = {}
+        # values that are read from somewhere else only when the metrics are scraped
+        self.functions: Dict[LabelKey, Callable[[], float]] = {}
+        self.lock = threading.Lock()
+
+    def set_function(self, function: Callable[[], float], **labels: str):
+        self.functions[get_label_key(labels)] = function
+
+    def samples(self) -> List[Tuple[LabelKey, float]]:
+        with self.lock:
+            samples = list(self.values.items())
+        samples += [(label_key, function()) for label_key, function in list(self.functions.items())]
+        return samples
+
+    def render(self) -> List[str]:
+        name = METRICS_PREFIX + self.name
+        lines = [f"# HELP {name} {self.help_text}", f"# TYPE {name} {self.kind}"]
+        for label_key, value in self.samples():
+            lines.append(f"{name}{format_labels(label_key)} {value:g}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: str):
+        label_key = get_label_key(labels)
+        with self.lock:
+            self.values[label_key] = self.values.get(label_key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str):
+        with self.lock:
+            self.values[get_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str):
+        label_key = get_label_key(labels)
+        with self.lock:
+            self.values[label_key] = self.values.get(label_key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = buckets
+        self.counts: Dict[LabelKey, List[int]] = {}
+        self.sums: Dict[LabelKey, float] = {}
+
+    def observe(self, value: float, **labels: str):
+        label_key = get_label_key(labels)
+        with self.lock:
+            counts = self.counts.setdefault(label_key, [0] * (len(self.buckets) + 1))
+            for num, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[num] += 1
+            counts[-1] += 1
+            self.sums[label_key] = self.sums.get(label_key, 0) + value
+
+    @contextmanager
+    def time(self, **labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        name = METRICS_PREFIX + self.name
+        lines = [f"# HELP {name} {self.help_text}", f"# TYPE {name} {self.kind}"]
+        with self.lock:
+            series = [(label_key, list(counts), self.sums[label_key]) for label_key, counts in self.counts.items()]
+        for label_key, counts, total in series:
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{name}_bucket{format_labels(label_key, {'le': f'{bound:g}'})} {count}")
+            lines.append(f"{name}_bucket{format_labels(label_key, {'le': '+Inf'})} {counts[-1]}")
+            lines.append(f"{name}_sum{format_labels(label_key)} {total:g}")
+            lines.append(f"{name}_count{format_labels(label_key)} {counts[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric_class, name: str, help_text: str):
+        # a metric is shared by every module that asks for the same name
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = metric_class(name, help_text)
+            return self.metrics[name]
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self.register(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self.register(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str) -> Histogram:
+        return self.register(Histogram, name, help_text)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def register_cache(name: str, cache):
+    registry.counter("cache_hits_total", "Lookups answered by a cache").set_function(lambda: cache.hits, cache=name)
+    registry.counter("cache_misses_total", "Lookups a cache could not answer").set_function(
+        lambda: cache.misses, cache=name
+    )
+    registry.gauge("cache_size_bytes", "Bytes held by a cache").set_function(lambda: cache.size, cache=name)
+
+
+def run_profiled(file_name: str, function: Callable, *args, **kwargs):
+    # only the calling thread is profiled, the work of the process pool workers shows up as waiting
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, file_name))
@@ -0,0 +1,97 @@
+import re
+import zlib
+from collections import defaultdict
+from typing import List, Tuple
+
+import numpy as np
+
+MAX_HASH = np.uint64(0xFFFFFFFF)
+SHINGLE_BASE = np.uint64(1000003)
+SUSPICIOUS_JACCARD_THRESHOLD = 0.5
+
+regex_to_split_tokens = re.compile(r'\w+|[^\w\s]+')
+
+
+def get_kgram_hashes(tokens: List[str], size: int) -> np.ndarray:
+    token_hashes = np.fromiter((zlib.crc32(token.encode()) for token in tokens), dtype=np.uint64, count=len(tokens))
+    window = min(size, len(token_hashes))
+    kgram_count = len(token_hashes) - window + 1 if window else 0
+    hashes = np.zeros(kgram_count, dtype=np.uint64)
+    for offset in range(window):
+        hashes = hashes * SHINGLE_BASE + token_hashes[offset:offset + kgram_count]
+    return hashes & MAX_HASH
+
+
+def get_shingle_hashes(content: str, shingle_size: int) -> np.ndarray:
+    return np.unique(get_kgram_hashes(regex_to_split_tokens.findall(content), shingle_size))
+
+
+def choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    # pick the banding whose S-curve 1 - (1 - s^r)^b has the least false positive
+    # plus false negative area around the threshold
+    similarities = np.linspace(0, 1, 201)
+    below = similarities < threshold
+    best, best_error = (num_perm, 1), float("inf")
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        probabilities = 1 - (1 - similarities ** rows) ** bands
+        error = np.trapz(probabilities[below], similarities[below]) + \
+            np.trapz(1 - probabilities[~below], similarities[~below])
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class MinHashIndex:
+
+    def __init__(self,
+                 num_perm: int = 128,
+                 threshold: float = SUSPICIOUS_JACCARD_THRESHOLD,
+                 shingle_size: int = 5,
+                 seed: int = 1):
+        self.num_perm = num_perm
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        generator = np.random.RandomState(seed)
+        # multiply-shift hashing: a * x + b wraps modulo 2^64 and the high 32 bits are kept
+        self.a = generator.randint(0, np.iinfo(np.uint64).max, size=(num_perm, 1), dtype=np.uint64) | np.uint64(1)
+        self.b = generator.randint(0, np.iinfo(np.uint64).max, size=(num_perm, 1), dtype=np.uint64)
+        self.signatures = np.empty((0, num_perm), dtype=np.uint64)
+        self.empty: List[bool] = []
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        if len(hashes) == 0:
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        return ((self.a * hashes + self.b) >> np.uint64(32)).min(axis=1)
+
+    def add(self, contents: List[str]):
+        signatures = [self.signatures]
+        for content in contents:
+            hashes = get_shingle_hashes(content, self.shingle_size)
+            signatures.append(self.signature(hashes)[np.newaxis])
+            self.empty.append(len(hashes) == 0)
+        self.signatures = np.concatenate(signatures)
+
+    def estimate_jaccard(self, first: int, second: int) -> float:
+        return float(np.mean(self.signatures[first] == self.signatures[second]))
+
+    def candidate_pairs(self) -> List[Tuple[int, int]]:
+        candidates = set()
+        for band in range(self.bands):
+            buckets = defaultdict(list)
+            band_signatures = self.signatures[:, band * self.rows:(band + 1) * self.rows]
+            for doc_num, band_signature in enumerate(band_signatures):
+                if not self.empty[doc_num]:
+                    buckets[band_signature.tobytes()].append(doc_num)
+            for bucket in buckets.values():
+                for i, first in enumerate(bucket):
+                    for second in bucket[i + 1:]:
+                        candidates.add((first, second))
+        return sorted(pair for pair in candidates if self.estimate_jaccard(*pair) >= self.threshold)
+
+
+def find_candidate_pairs(contents: List[str], threshold: float = SUSPICIOUS_JACCARD_THRESHOLD) -> List[Tuple[int, int]]:
+    index = MinHashIndex(threshold=threshold)
+    index.add(contents)
+    return index.candidate_pairs()
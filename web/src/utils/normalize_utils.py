@@ -0,0 +1,71 @@
+import os
+import re
+from typing import List
+
+from web.src.models.corpus import get_content_hash
+from web.src.utils.cache_utils import LRUCache
+from web.src.utils.metrics_utils import register_cache, registry
+
+CLEAN_CACHE_BYTES = int(os.environ.get("CLEAN_CACHE_BYTES", 32 * 1024 * 1024))
+
+clean_cache = LRUCache(CLEAN_CACHE_BYTES, size_of=lambda content: len(content.encode("utf-8")))
+register_cache("clean", clean_cache)
+normalize_seconds = registry.histogram("normalize_seconds", "Time spent normalizing solutions that were not cached")
+
+HASKELL_SYMBOLS = r'!#$%&*+./<=>?@\\^|~:\-'
+
+# only literals and comments are matched, the code between them is copied with its blanks collapsed;
+# the leading lookahead lets the scanner skip every other character without trying the alternatives
+regex_to_find_literals_and_comments = re.compile(r'''(?=["'{-])(?:
+    (?P<string>"(?:[^"\\\n]|\\.)*"?)
+  | (?P<char>(?<![\w'])'(?:[^'\\\n]|\\[^'\n]*)')
+  | (?P<block_comment>\{-)
+  | (?P<line_comment>(?<![SYMBOLS])--+(?![SYMBOLS])[^\n]*))
+'''.replace("SYMBOLS", HASKELL_SYMBOLS), re.VERBOSE)
+regex_to_find_comment_delimiters = re.compile(r'\{-|-\}')
+regex_to_find_blanks = re.compile(r'[^\S\n]+')
+
+
+def skip_block_comment(content: str, position: int) -> int:
+    # block comments nest, so only the matching -} closes the one opened at position
+    depth = 0
+    for delimiter in regex_to_find_comment_delimiters.finditer(content, position):
+        depth += 1 if delimiter.group() == "{-" else -1
+        if depth == 0:
+            return delimiter.end()
+    return len(content)
+
+
+def normalize_source(content: str) -> str:
+    parts: List[str] = []
+    position = 0
+    after_comment = False
+    while True:
+        match = regex_to_find_literals_and_comments.search(content, position)
+        end = match.start() if match else len(content)
+        code = regex_to_find_blanks.sub(" ", content[position:end])
+        if after_comment and parts and parts[-1].endswith(" "):
+            code = code.lstrip(" ")
+        parts.append(code)
+        if match is None:
+            break
+        kind = match.lastgroup
+        after_comment = kind in ("block_comment", "line_comment")
+        if kind == "block_comment":
+            position = skip_block_comment(content, end)
+        else:
+            position = match.end()
+            if not after_comment:
+                parts.append(match.group())
+    lines = "".join(parts).split("\n")
+    return "\n".join(line.strip() for line in lines if line and not line.isspace())
+
+
+def clean_solution_content(solution_content: str) -> str:
+    content_hash = get_content_hash(solution_content)
+    cleaned = clean_cache.get(content_hash)
+    if cleaned is None:
+        with normalize_seconds.time():
+            cleaned = normalize_source(solution_content)
+        clean_cache.put(content_hash, cleaned)
+    return cleaned
@@ -0,0 +1,47 @@
+import concurrent.futures
+import os
+from typing import List, Tuple, Iterator
+
+DEFAULT_WORKERS = int(os.environ.get("TABLE_WORKERS", os.cpu_count() or 1))
+MIN_PAIRS_FOR_POOL = 64
+CHUNKS_PER_WORKER = 4
+
+# set once per pool process by _init_worker; threads of the main process never use them
+_contents: List[str] = []
+_comparison_method = None
+
+
+def _init_worker(contents: List[str], comparison_method):
+    global _contents, _comparison_method
+    _contents = contents
+    _comparison_method = comparison_method
+
+
+def _compare_chunk(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int, object]]:
+    return [(row_num, col_num, _comparison_method(_contents[row_num], _contents[col_num])) for row_num, col_num in pairs]
+
+
+def split_pairs(pairs: List[Tuple[int, int]], chunk_count: int) -> List[List[Tuple[int, int]]]:
+    chunk_size = max(1, -(-len(pairs) // chunk_count))
+    return [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+
+
+def compare_pairs(contents: List[str],
+                  comparison_method,
+                  pairs: List[Tuple[int, int]],
+                  workers: int | None = None) -> Iterator[Tuple[int, int, object]]:
+    workers = DEFAULT_WORKERS if workers is None else workers
+    if workers <= 1 or len(pairs) < MIN_PAIRS_FOR_POOL:
+        # builds run concurrently on the computation threads, so the arguments are used directly
+        for row_num, col_num in pairs:
+            yield row_num, col_num, comparison_method(contents[row_num], contents[col_num])
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(contents, comparison_method)
+    ) as executor:
+        futures = [executor.submit(_compare_chunk, chunk) for chunk in split_pairs(pairs, workers * CHUNKS_PER_WORKER)]
+        for future in concurrent.futures.as_completed(futures):
+            yield from future.result()
@@ -0,0 +1,51 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Tuple
+
+DEFAULT_SCORE_STORE_PATH = os.environ.get("SCORE_STORE_PATH", "scores.sqlite3")
+
+
+def get_pair_key(first_hash: str, second_hash: str, symmetric: bool) -> Tuple[str, str]:
+    if symmetric and second_hash < first_hash:
+        return second_hash, first_hash
+    return first_hash, second_hash
+
+
+class ScoreStore:
+
+    def __init__(self, path: str = DEFAULT_SCORE_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                "metric TEXT NOT NULL, first TEXT NOT NULL, second TEXT NOT NULL, score REAL, "
+                "PRIMARY KEY (metric, first, second)) WITHOUT ROWID"
+            )
+            self.connection.execute("CREATE TEMP TABLE corpus_hashes (hash TEXT PRIMARY KEY)")
+
+    def load(self, metric: str, hashes: List[str], including: str | None = None) -> Dict[Tuple[str, str], float | None]:
+        # with including, only the pairs of that one document are loaded
+        query = (
+            "SELECT first, second, score FROM scores "
+            "WHERE metric = ? AND first IN corpus_hashes AND second IN corpus_hashes"
+        )
+        parameters = (metric,)
+        if including is not None:
+            query += " AND ? IN (first, second)"
+            parameters += (including,)
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM corpus_hashes")
+            self.connection.executemany("INSERT OR IGNORE INTO corpus_hashes VALUES (?)", ((h,) for h in hashes))
+            rows = self.connection.execute(query, parameters).fetchall()
+        return {(first, second): score for first, second, score in rows}
+
+    def save(self, metric: str, scores: List[Tuple[str, str, float | None]]):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)",
+                ((metric, first, second, score) for first, second, score in scores)
+            )
@@ -0,0 +1,40 @@
+import re
+from typing import List
+
+HASKELL_KEYWORDS = frozenset({
+    "case", "class", "data", "default", "deriving", "do", "else", "foreign", "if", "import", "in", "infix",
+    "infixl", "infixr", "instance", "let", "module", "newtype", "of", "then", "type", "where", "_"
+})
+
+VARIABLE_TOKEN = "v"
+CONSTRUCTOR_TOKEN = "C"
+NUMBER_TOKEN = "0"
+STRING_TOKEN = '""'
+
+regex_to_split_haskell_tokens = re.compile(r'''
+    (?P<string>"(?:[^"\\\n]|\\.)*")
+  | (?P<char>'(?:[^'\\\n]|\\[^'\n]*)')
+  | (?P<number>0[xX][0-9a-fA-F]+|0[oO][0-7]+|\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<variable>[a-z_][\w']*)
+  | (?P<constructor>[A-Z][\w']*)
+  | (?P<symbol>[!#$%&*+./<=>?@\\^|~:-]+)
+  | (?P<special>[()\[\],;`{}])
+''', re.VERBOSE)
+
+
+def tokenize_haskell(content: str) -> List[str]:
+    # identifiers and literals are replaced by their kind, so renaming does not change the token stream
+    tokens = []
+    for match in regex_to_split_haskell_tokens.finditer(content):
+        kind, token = match.lastgroup, match.group()
+        if kind == "variable":
+            tokens.append(token if token in HASKELL_KEYWORDS else VARIABLE_TOKEN)
+        elif kind == "constructor":
+            tokens.append(CONSTRUCTOR_TOKEN)
+        elif kind == "number":
+            tokens.append(NUMBER_TOKEN)
+        elif kind in ("string", "char"):
+            tokens.append(STRING_TOKEN)
+        else:
+            tokens.append(token)
+    return tokens
@@ -0,0 +1,223 @@
+import heapq
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from jellyfish import damerau_levenshtein_distance, hamming_distance, jaro_similarity, jaro_winkler_similarity
+from jellyfish import levenshtein_distance
+
+from web.src.models.corpus import Corpus
+from web.src.models.similarity_matrix import SimilarityMatrix
+from web.src.utils.diff_utils import TABLE_BUILDERS
+
+DEFAULT_TOP_PAIRS = 50
+# characters past ASCII share one bucket, which can only make the bounds looser
+CHARACTER_BUCKETS = 129
+
+
+def get_character_histograms(contents: List[str]) -> np.ndarray:
+    histograms = np.zeros((len(contents), CHARACTER_BUCKETS), dtype=np.int32)
+    for doc_num, content in enumerate(contents):
+        codes = np.frombuffer(content.encode("utf-32-le"), dtype=np.uint32)
+        histograms[doc_num] = np.bincount(np.minimum(codes, CHARACTER_BUCKETS - 1), minlength=CHARACTER_BUCKETS)
+    return histograms
+
+
+def get_shared_characters(histograms: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    shared = np.empty(len(rows), dtype=np.int64)
+    for start in range(0, len(rows), 4096):
+        chunk = slice(start, start + 4096)
+        shared[chunk] = np.minimum(histograms[rows[chunk]], histograms[cols[chunk]]).sum(axis=1)
+    return shared
+
+
+class LineFeatures:
+
+    def __init__(self, documents: List):
+        self.documents = documents
+        self.lengths = np.array([len(document) for document in documents], dtype=float)
+        self.counters = [Counter(document) for document in documents]
+
+    def real_quick_ratio(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        # SequenceMatcher.real_quick_ratio: at most the shorter sequence can match
+        totals = self.lengths[rows] + self.lengths[cols]
+        return 2 * np.minimum(self.lengths[rows], self.lengths[cols]) / np.maximum(totals, 1)
+
+    def quick_ratio(self, row_num: int, col_num: int) -> float:
+        # SequenceMatcher.quick_ratio: matched lines are bounded by the shared multiset of lines
+        shared = sum((self.counters[row_num] & self.counters[col_num]).values())
+        return 2 * shared / max(self.lengths[row_num] + self.lengths[col_num], 1)
+
+
+class CharacterFeatures:
+
+    def __init__(self, contents: List[str]):
+        self.contents = contents
+        self.lengths = np.array([len(content) for content in contents], dtype=float)
+        self.histograms = get_character_histograms(contents)
+
+    def jaro_bound(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        # jaro = (m / |a| + m / |b| + (m - t) / m) / 3, and matching characters must be equal,
+        # so m is at most the shared multiset of characters
+        matches = get_shared_characters(self.histograms, rows, cols).astype(float)
+        first, second = np.maximum(self.lengths[rows], 1), np.maximum(self.lengths[cols], 1)
+        return np.where(matches > 0, (matches / first + matches / second + 1) / 3, 0.0)
+
+    def jaro_winkler_bound(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        # the prefix boost is at most 4 * 0.1 * (1 - jaro), only given above 0.7, and grows with jaro
+        jaro = self.jaro_bound(rows, cols)
+        return np.where(jaro > 0.7, jaro + 0.4 * (1 - jaro), jaro)
+
+    def levenshtein_bound(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        # every edit changes the character histogram by at most two, and the length by at most one;
+        # transpositions change neither, and a hamming mismatch is one substitution, so it bounds those too
+        difference = np.abs(self.histograms[rows] - self.histograms[cols]).sum(axis=1) / 2
+        length_difference = np.abs(self.lengths[rows] - self.lengths[cols])
+        return -np.maximum(difference, length_difference)
+
+
+class LevenshteinFeatures(CharacterFeatures):
+
+    def __init__(self, contents: List[str]):
+        super().__init__(contents)
+        self.bigrams = [Counter(content[num:num + 2] for num in range(len(content) - 1)) for content in contents]
+
+    def bigram_bound(self, row_num: int, col_num: int) -> float:
+        # q-gram lemma: one edit destroys at most two bigrams of the longer string
+        shared = sum((self.bigrams[row_num] & self.bigrams[col_num]).values())
+        longest = max(self.lengths[row_num], self.lengths[col_num])
+        return -max(0.0, (longest - 1 - shared) / 2)
+
+
+class BoundedMetric:
+    # scores are searched as keys where higher is more suspicious; distances are negated
+
+    def __init__(self,
+                 prepare: Callable,
+                 score: Callable,
+                 bound: Callable,
+                 pair_bounds: List[Callable] | None = None,
+                 higher_is_similar: bool = True):
+        self.prepare = prepare
+        self.score = score
+        self.bound = bound
+        self.pair_bounds = pair_bounds or []
+        self.higher_is_similar = higher_is_similar
+
+
+def get_similarity(features: LineFeatures, row_num: int, col_num: int) -> float:
+    # the table compares both directions, and a pair is ranked by the more similar one
+    first, second = features.documents[row_num], features.documents[col_num]
+    return max(SequenceMatcher(a=first, b=second).ratio(), SequenceMatcher(a=second, b=first).ratio())
+
+
+BOUNDED_METRICS: Dict[str, BoundedMetric] = {
+    "similarity": BoundedMetric(
+        prepare=lambda contents: LineFeatures([content.split('\n') for content in contents]),
+        score=get_similarity,
+        bound=LineFeatures.real_quick_ratio,
+        pair_bounds=[LineFeatures.quick_ratio]
+    ),
+    "jaro_sim": BoundedMetric(
+        prepare=CharacterFeatures,
+        score=lambda features, row_num, col_num: jaro_similarity(
+            features.contents[row_num], features.contents[col_num]
+        ),
+        bound=CharacterFeatures.jaro_bound
+    ),
+    "levenshtein_dist": BoundedMetric(
+        prepare=LevenshteinFeatures,
+        score=lambda features, row_num, col_num: -levenshtein_distance(
+            features.contents[row_num], features.contents[col_num]
+        ),
+        bound=CharacterFeatures.levenshtein_bound,
+        pair_bounds=[LevenshteinFeatures.bigram_bound],
+        higher_is_similar=False
+    ),
+    "damerau_levenshtein_dist": BoundedMetric(
+        prepare=CharacterFeatures,
+        score=lambda features, row_num, col_num: -damerau_levenshtein_distance(
+            features.contents[row_num], features.contents[col_num]
+        ),
+        bound=CharacterFeatures.levenshtein_bound,
+        higher_is_similar=False
+    ),
+    "jaro_winkler_sim": BoundedMetric(
+        prepare=CharacterFeatures,
+        score=lambda features, row_num, col_num: jaro_winkler_similarity(
+            features.contents[row_num], features.contents[col_num]
+        ),
+        bound=CharacterFeatures.jaro_winkler_bound
+    ),
+    "hamming_dist": BoundedMetric(
+        prepare=CharacterFeatures,
+        score=lambda features, row_num, col_num: -hamming_distance(
+            features.contents[row_num], features.contents[col_num]
+        ),
+        bound=CharacterFeatures.levenshtein_bound,
+        higher_is_similar=False
+    ),
+}
+
+# metrics scored by one sparse product are exact for all pairs at once, so their whole table is built
+SPARSE_METRICS = {"cosine_similarity", "winnowing"}
+# match_rating_cmp only says yes or no, so its pairs can be neither ranked nor pruned
+TOP_PAIRS_METRICS = set(BOUNDED_METRICS) | SPARSE_METRICS
+
+
+def get_pair_arrays(size: int, pairs: List[Tuple[int, int]] | None) -> Tuple[np.ndarray, np.ndarray]:
+    if pairs is None:
+        return np.triu_indices(size, k=1)
+    if not pairs:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    rows, cols = np.array(pairs).T
+    return rows, cols
+
+
+def search_top_pairs(corpus: Corpus,
+                     metric: BoundedMetric,
+                     k: int,
+                     pairs: List[Tuple[int, int]] | None = None) -> Tuple[List[Tuple[int, int, float]], dict]:
+    rows, cols = get_pair_arrays(len(corpus), pairs)
+    if k <= 0:
+        # the pruning compares against the k-th best score, which does not exist
+        return [], {"candidates": len(rows), "scored": 0, "pruned": len(rows)}
+    features = metric.prepare(corpus.contents)
+    bounds = metric.bound(features, rows, cols)
+    statistics = {"candidates": len(rows), "scored": 0, "pruned": 0}
+    best: List[Tuple[float, int, int]] = []
+    # pairs are visited from the highest bound down, so once the bound cannot beat
+    # the k-th best score none of the remaining pairs can either
+    for pair_num in np.argsort(-bounds, kind="stable"):
+        if len(best) == k and bounds[pair_num] <= best[0][0]:
+            break
+        row_num, col_num = int(rows[pair_num]), int(cols[pair_num])
+        if len(best) == k and any(
+                pair_bound(features, row_num, col_num) <= best[0][0] for pair_bound in metric.pair_bounds
+        ):
+            continue
+        statistics["scored"] += 1
+        key = metric.score(features, row_num, col_num)
+        if len(best) < k:
+            heapq.heappush(best, (key, row_num, col_num))
+        elif key > best[0][0]:
+            heapq.heapreplace(best, (key, row_num, col_num))
+    statistics["pruned"] = statistics["candidates"] - statistics["scored"]
+    sign = 1 if metric.higher_is_similar else -1
+    return [(row_num, col_num, sign * key) for key, row_num, col_num in sorted(best, reverse=True)], statistics
+
+
+def find_top_pairs(corpus: Corpus,
+                   metric: str,
+                   k: int = DEFAULT_TOP_PAIRS,
+                   pairs: List[Tuple[int, int]] | None = None) -> Tuple[List[dict], dict]:
+    if metric in SPARSE_METRICS:
+        table: SimilarityMatrix = TABLE_BUILDERS[metric](corpus, pairs=pairs)
+        rows, _, _ = table.pair_scores()
+        return table.top_pairs(k), {"candidates": len(rows), "scored": len(rows), "pruned": 0}
+    top_pairs, statistics = search_top_pairs(corpus, BOUNDED_METRICS[metric], k, pairs)
+    return [
+        {"first": corpus.owners[row_num], "second": corpus.owners[col_num], "score": float(score)}
+        for row_num, col_num, score in top_pairs
+    ], statistics
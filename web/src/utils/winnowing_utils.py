@@ -0,0 +1,70 @@
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.sparse import csr_matrix
+
+from web.src.utils.minhash_utils import get_kgram_hashes
+from web.src.utils.token_utils import tokenize_haskell
+
+# k-grams shorter than KGRAM_SIZE tokens are noise; any match of at least
+# KGRAM_SIZE + WINDOW_SIZE - 1 tokens is guaranteed to share a fingerprint
+KGRAM_SIZE = 5
+WINDOW_SIZE = 4
+
+
+def winnow(hashes: np.ndarray, window_size: int = WINDOW_SIZE) -> np.ndarray:
+    if len(hashes) <= window_size:
+        return hashes[hashes == hashes.min()][:1] if len(hashes) else hashes
+    windows = sliding_window_view(hashes, window_size)
+    # robust winnowing: on ties the rightmost minimum is taken, so runs of equal hashes select one fingerprint
+    positions = np.arange(len(windows)) + window_size - 1 - np.argmin(windows[:, ::-1], axis=1)
+    return np.unique(hashes[np.unique(positions)])
+
+
+def get_fingerprints(content: str, kgram_size: int = KGRAM_SIZE, window_size: int = WINDOW_SIZE) -> np.ndarray:
+    return winnow(get_kgram_hashes(tokenize_haskell(content), kgram_size), window_size)
+
+
+class WinnowingIndex:
+
+    def __init__(self, kgram_size: int = KGRAM_SIZE, window_size: int = WINDOW_SIZE):
+        self.kgram_size = kgram_size
+        self.window_size = window_size
+        self.postings: Dict[int, List[int]] = defaultdict(list)
+        self.sizes: List[int] = []
+
+    def add(self, contents: List[str]):
+        for content in contents:
+            doc_num = len(self.sizes)
+            fingerprints = get_fingerprints(content, self.kgram_size, self.window_size)
+            for fingerprint in fingerprints.tolist():
+                self.postings[fingerprint].append(doc_num)
+            self.sizes.append(len(fingerprints))
+
+    def overlap_matrix(self) -> np.ndarray:
+        # each posting list is a column of the fingerprint incidence matrix, so one sparse
+        # product counts the shared fingerprints of every pair without comparing documents
+        doc_nums = [doc_num for posting in self.postings.values() for doc_num in posting]
+        fingerprint_nums = np.repeat(np.arange(len(self.postings)), [len(posting) for posting in self.postings.values()])
+        incidence = csr_matrix(
+            (np.ones(len(doc_nums), dtype=np.int32), (doc_nums, fingerprint_nums)),
+            shape=(len(self.sizes), len(self.postings))
+        )
+        return (incidence @ incidence.T).toarray()
+
+    def similarity_matrix(self) -> np.ndarray:
+        sizes = np.array(self.sizes, dtype=float)
+        totals = sizes[:, np.newaxis] + sizes[np.newaxis, :]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarities = np.where(totals > 0, 2 * self.overlap_matrix() / totals, 0.0)
+        return similarities
+
+
+def compute_winnowing_similarities(contents: List[str],
+                                   kgram_size: int = KGRAM_SIZE,
+                                   window_size: int = WINDOW_SIZE) -> np.ndarray:
+    index = WinnowingIndex(kgram_size, window_size)
+    index.add(contents)
+    return index.similarity_matrix()